@@ -1,9 +1,36 @@
 #!/usr/bin/env python
 import sys
+import os
+import io
+import json
+import pickle
+import hashlib
+import tempfile
+import mmap
+import shutil
+import argparse
 
 import ply.lex as lex
 import ply.yacc as yacc
 
+# bump whenever the tokens or grammar change, optimized tables are trusted as they are on disk
+TABLES_VERSION = 1
+TABLES_DIR = os.path.dirname(os.path.abspath(__file__))
+COMPILED_VERSION = 1
+
+def tables(module, build):
+    # PLY writes its tables in place, and a process importing one half written gets a SyntaxError instead of
+    # the ImportError it falls back on, so a missing table is written to a scratch directory and moved in whole
+    if os.path.exists(os.path.join(TABLES_DIR, module+'.py')): return build(TABLES_DIR)
+    scratch = tempfile.mkdtemp(dir=TABLES_DIR)
+    try:
+        built = build(scratch)
+        if os.path.exists(os.path.join(scratch, module+'.py')):
+            os.replace(os.path.join(scratch, module+'.py'), os.path.join(TABLES_DIR, module+'.py'))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return built
+
 class Lexer():
     states = (
         ('string', 'exclusive'),
@@ -114,10 +141,13 @@ class Lexer():
         t.lexer.skip(1)
 
     def build(self, **kwargs):
-        self.lexer = lex.lex(module=self, **kwargs)
+        lextab = 'arealextab_v%d'%(TABLES_VERSION)
+        self.lexer = tables(lextab, lambda outputdir: lex.lex(module=self, optimize=True, lextab=lextab,
+                                                              outputdir=outputdir, **kwargs))
+        return self.lexer
 
     def lex_file(self, file):
-        lexer = lex.lex(module=self)
+        lexer = self.build()
         with open(file, 'r') as f:
             lexer.input(f.read())
         while True:
@@ -294,14 +324,325 @@ class Parser():
     def __init__(self):
         self.tokens = Lexer.tokens
         self.lexer = Lexer().build()
-        self.parser = yacc.yacc(module=self)
+        tabmodule = 'areaparsetab_v%d'%(TABLES_VERSION)
+        self.parser = tables(tabmodule, lambda outputdir: yacc.yacc(module=self, optimize=True, debug=False,
+                                                                    write_tables=True, tabmodule=tabmodule,
+                                                                    outputdir=outputdir))
 
     def parse(self, buffer):
+        # the same lexer serves every file, so clear what the last one left behind
+        self.lexer.begin('INITIAL')
+        self.lexer.lineno = 1
         return self.parser.parse(buffer, lexer=self.lexer, debug=False)
 
+class Reader():
+    # line oriented alternative to the grammar above that streams records from a file object
+    # records have the same shapes the parser produces, mobiles, objects and specials are skipped over
+    def sections(self, f):
+        # yields (header, records), a section's records are drained before the next header is read
+        self.lines = (line.rstrip('\n') for line in f)
+        self.back = []
+        self.lineno = 0
+        readers = {'#AREA': self.area, '#MOBILES': self.mobiles, '#OBJECTS': self.objects,
+                   '#ROOMS': self.rooms, '#RESETS': self.resets, '#SHOPS': self.shops,
+                   '#SPECIALS': self.specials}
+        while True:
+            line = self.line()
+            if line is None or line.strip() == '#$': return
+            header = line.strip()
+            if not header: continue
+            if header not in readers: self.error(line)
+            records = readers[header]()
+            yield header, records
+            for r in records: pass
+
+    def parse(self, buffer):
+        # same result as Parser.parse, sections without records are None and #AREA is its one record
+        area = []
+        for header, records in self.sections(io.StringIO(buffer)):
+            records = list(records)
+            area.append((header, records[0] if header == '#AREA' else records or None))
+        return area
+
+    def line(self):
+        if len(self.back): return self.back.pop()
+        self.lineno += 1
+        return next(self.lines, None)
+
+    def string(self):
+        text = []
+        while True:
+            line = self.line()
+            if line is None: self.error('EOF')
+            if '~' in line:
+                text.append(line[:line.index('~')])
+                return '\n'.join(text).strip()
+            text.append(line)
+
+    def numbers(self, line):
+        # numbers up to an optional trailing comment, and the comment
+        fields, _, comment = line.partition('*')
+        return fields.split(), '*'+comment if _ else None
+
+    def error(self, line):
+        print('Syntax error in input at line %d: %s'%(self.lineno, line))
+        sys.exit(1)
+
+    def vnums(self):
+        # record headers of a vnum section up to its #0
+        while True:
+            line = self.line()
+            if line is None: self.error('EOF')
+            line = line.strip()
+            if not line: continue
+            if line == '#0': return
+            if not line.startswith('#'): self.error(line)
+            yield int(line[1:])
+
+    def skip(self):
+        # everything up to the next record header
+        while True:
+            line = self.line()
+            if line is None: return
+            if line.startswith('#'):
+                self.back.append(line)
+                return
+            if line.strip() == 'E':
+                self.string()
+                self.string()
+
+    def area(self):
+        strings = (self.string(), self.string(), self.string())
+        fields, comment = self.numbers(self.line())
+        yield strings + ((int(fields[0]), int(fields[1])),)
+
+    def mobiles(self):
+        for vnum in self.vnums():
+            for i in range(5): self.string()
+            self.skip()
+            yield ()
+
+    def objects(self):
+        for vnum in self.vnums():
+            for i in range(4): self.string()
+            self.skip()
+            yield ()
+
+    def rooms(self):
+        for vnum in self.vnums():
+            name = self.string()
+            desc = self.string()
+            self.line()
+            optionals = []
+            while True:
+                line = self.line()
+                if line is None: self.error('EOF')
+                line = line.strip()
+                if line == 'S': break
+                if line.startswith('D'):
+                    direction = int(line[1:])
+                    self.string()
+                    self.string()
+                    fields, comment = self.numbers(self.line())
+                    optionals.append((direction, int(fields[2])))
+                elif line.startswith('E'):
+                    self.string()
+                    self.string()
+                    optionals.append(None)
+                elif line.startswith('H'):
+                    optionals.append(None)
+                elif line:
+                    self.error(line)
+            yield (vnum, name, desc, optionals or None)
+
+    def resets(self):
+        while True:
+            line = self.line()
+            if line is None: self.error('EOF')
+            if line.strip() == 'S': return
+            if not line.strip() or line.startswith('*'): continue
+            fields, comment = self.numbers(line)
+            yield [fields[0]] + [int(v) for v in fields[1:]] + [comment]
+
+    def shops(self):
+        while True:
+            line = self.line()
+            if line is None: self.error('EOF')
+            if line.strip() == '0': return
+            if not line.strip(): continue
+            fields, comment = self.numbers(line)
+            yield [int(v) for v in fields] + [comment]
+
+    def specials(self):
+        while True:
+            line = self.line()
+            if line is None: self.error('EOF')
+            if line.strip() == 'S': return
+            if line.strip(): yield ()
+
+class Index():
+    # byte offsets of the sections and #<vnum> records of an area file, kept in a sidecar next to it
+    # sections are (start, end, end of records) with the last one pointing at the #0 of vnum sections
+    # lookups parse only the slice they need out of an mmap of the file
+    headers = (b'#AREA', b'#MOBILES', b'#OBJECTS', b'#ROOMS', b'#RESETS', b'#SHOPS', b'#SPECIALS')
+    records = (b'#MOBILES', b'#OBJECTS', b'#ROOMS')
+
+    def __init__(self, path):
+        self.path = path
+        self.sidecar = path + '.idx'
+        st = os.stat(path)
+        self.stamp = [st.st_size, st.st_mtime_ns]
+        try:
+            with open(self.sidecar, 'r') as f:
+                index = json.load(f)
+            if index['stamp'] != self.stamp: raise ValueError('stale index')
+        except (OSError, ValueError, KeyError):
+            index = self.build()
+        self.sections = {k: tuple(v) for k, v in index['sections'].items()}
+        self.vnums = {k: [tuple(r) for r in v] for k, v in index['vnums'].items()}
+
+    def build(self):
+        sections, vnums = {}, {}
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            current = None
+            offset = 0
+            while offset < len(m):
+                line = m.readline()
+                token = line.strip()
+                if token in self.headers or token == b'#$':
+                    if current is not None: sections[current][1] = offset
+                    current = token.decode() if token != b'#$' else None
+                    if current is not None:
+                        sections[current] = [offset, len(m), len(m)]
+                        if token in self.records: vnums[current] = []
+                elif current in vnums and token == b'#0':
+                    sections[current][2] = offset
+                elif current in vnums and token.startswith(b'#') and token[1:].isdigit():
+                    vnums[current].append([int(token[1:]), offset])
+                offset += len(line)
+        index = {'stamp': self.stamp, 'sections': sections, 'vnums': vnums}
+        try:
+            with open(self.sidecar, 'w') as f:
+                json.dump(index, f)
+        except OSError:
+            pass
+        return index
+
+    def slice(self, start, end):
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return m[start:end].decode(errors='replace')
+
+    def section(self, header):
+        # records of one section, None if the file doesn't have it
+        if header not in self.sections: return None
+        return dict(Reader().parse(self.slice(*self.sections[header][:2])))[header]
+
+    def between(self, header, lo, hi):
+        # records of a vnum section with lo <= vnum <= hi, in file order
+        records = self.vnums.get(header, [])
+        spans = []
+        for i, (vnum, start) in enumerate(records):
+            if not lo <= vnum <= hi: continue
+            end = records[i+1][1] if i+1 < len(records) else self.sections[header][2]
+            if len(spans) and spans[-1][1] == start:
+                spans[-1][1] = end
+            else:
+                spans.append([start, end])
+        found = []
+        for start, end in spans:
+            found += dict(Reader().parse(header + '\n' + self.slice(start, end) + '#0\n'))[header] or []
+        return found
+
+    def room(self, vnum):
+        rooms = self.between('#ROOMS', vnum, vnum)
+        return rooms[0] if len(rooms) else None
+
+class Compiled():
+    # parsed areas pickled into a cache directory, one entry per source file and parser
+    # an entry starts with a small header so staleness is checked without unpickling the sections
+    # it is reused while the size and mtime of the source match, or failing that its content hash
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def entry(self, source, backend):
+        name = hashlib.sha256(os.path.abspath(source).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.path, '%s.%s.%s.v%d'%(os.path.basename(source), name, backend, COMPILED_VERSION))
+
+    def load(self, source, backend='fast'):
+        # sections of an area file, in the shape the parsers return them
+        st = os.stat(source)
+        stamp = [st.st_size, st.st_mtime_ns]
+        digest = None
+        try:
+            with open(self.entry(source, backend), 'rb') as f:
+                header = pickle.load(f)
+                if header['stamp'] == stamp: return pickle.load(f)
+                digest = self.digest(source)
+                if header['digest'] == digest:
+                    sections = pickle.load(f)
+                    self.store(source, backend, stamp, digest, sections)
+                    return sections
+        except (OSError, EOFError, KeyError, pickle.UnpicklingError):
+            pass
+        with open(source, 'r') as f:
+            buffer = f.read()
+        sections = Reader().parse(buffer) if backend == 'fast' else Parser().parse(buffer)
+        self.store(source, backend, stamp, digest or self.digest(source), sections)
+        return sections
+
+    def digest(self, source):
+        with open(source, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def store(self, source, backend, stamp, digest, sections):
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump({'stamp': stamp, 'digest': digest}, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(sections, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.entry(source, backend))
+
+def differences(parser, reader, buffer):
+    # sections the streaming reader reads differently from the grammar, the ones it skips over aside
+    fast = dict(reader.parse(buffer))
+    return [header for header, records in parser.parse(buffer)
+            if header not in ('#MOBILES', '#OBJECTS', '#SPECIALS') and fast.get(header) != records]
+
 def main():
-    with open(file, 'r') as f:
-        area = Parser().parse(sys.argv[1])
+    cli = argparse.ArgumentParser(description='Parse area files.')
+    cli.add_argument('files', nargs='+', help='area files')
+    cli.add_argument('--check', action='store_true',
+                     help='parse with both the grammar and the streaming reader and report differences')
+    cli.add_argument('--compile', metavar='DIR', default=None,
+                     help='store the parsed files in DIR, reusing entries whose source is unchanged')
+    cli.add_argument('--room', type=int, default=None,
+                     help='print one room looked up through the byte offset index instead of parsing')
+    args = cli.parse_args()
+
+    if args.room is not None:
+        for file in args.files:
+            room = Index(file).room(args.room)
+            if room is not None: print(room)
+        return
+
+    if args.compile is not None:
+        compiled = Compiled(args.compile)
+        for file in args.files:
+            compiled.load(file)
+        return
+
+    parser, reader = Parser(), Reader()
+    failed = 0
+    for file in args.files:
+        with open(file, 'r') as f:
+            buffer = f.read()
+        if not args.check:
+            parser.parse(buffer)
+            continue
+        for header in differences(parser, reader, buffer):
+            print('%s: %s differs between parsers'%(file, header))
+            failed += 1
+    sys.exit(1 if failed else 0)
 
 if __name__=='__main__':
     main()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+
+import os
+import io
+import collections
+import argparse
+import contextlib
+import multiprocessing
+
+import AreaParser
+import World
+import RoomGraph
+import Matrix
+import Solvers
+import Render
+import Mapper
+
+# empty cells kept between area boxes, and between the pieces packed into a row
+SPACING = 1
+# grid cell size of the spatial hash spread() looks up placed boxes in
+CELL = 32
+
+def lay_out(job):
+    # pool worker: lay out every component of one area as Mapper does, packed side by side
+    # returns the area's rooms (dummies included) and exits with its log in one piece
+    path, area, rooms, outside, options, engine, decompose, cache, incremental = job
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        g = RoomGraph.RoomGraph.from_records(rooms)
+        pieces = []
+        for members in g.components():
+            rdb = Mapper.materialize(g, members)
+            exits, restored = Mapper.arrange(rdb, area, options, engine, decompose, cache, incremental, outside)
+            pieces.append((rdb, exits))
+        rdb, exits = {}, []
+        offsets = pack([extent([r for r in piece.values() if not r.dummy]) for piece, e in pieces])
+        for (piece, e), (dx, dy) in zip(pieces, offsets):
+            for r in piece.values():
+                r.x, r.y = r.x + dx, r.y + dy
+                if r.vnum not in rdb or rdb[r.vnum].dummy: rdb[r.vnum] = r
+            exits += e
+    return path, rdb, exits, log.getvalue()
+
+def extent(rooms):
+    # (x, y, width, height) of the cells some rooms cover
+    if not len(rooms): return (0, 0, 1, 1)
+    xs, ys = [round(r.x) for r in rooms], [round(r.y) for r in rooms]
+    return (min(xs), min(ys), max(xs) - min(xs) + 1, max(ys) - min(ys) + 1)
+
+def pack(boxes):
+    # shelf packing of (x, y, width, height) boxes into rows about as wide as the total is high
+    # returns the shift of every box that moves its corner to its place
+    if not len(boxes): return []
+    width = max(max([b[2] for b in boxes]), int(sum([(b[2]+SPACING)*(b[3]+SPACING) for b in boxes])**.5))
+    offsets = [None]*len(boxes)
+    x = y = row = 0
+    for i in sorted(range(len(boxes)), key=lambda i: -boxes[i][3]):
+        bx, by, w, h = boxes[i]
+        if x and x + w > width:
+            x, y, row = 0, y + row + SPACING, 0
+        offsets[i] = (x - bx, y - by)
+        x += w + SPACING
+        row = max(row, h)
+    return offsets
+
+def overlaps(boxes, positions, done):
+    # pairs of boxes that overlap at their positions and have no separation yet, by a sweep along x
+    order = sorted(range(len(boxes)), key=lambda i: positions[i][0])
+    found = []
+    active = []
+    for i in order:
+        x, y = positions[i]
+        active = [j for j in active if positions[j][0] + boxes[j][0] + SPACING > x]
+        for j in active:
+            if (min(i, j), max(i, j)) in done: continue
+            if positions[j][1] < y + boxes[i][1] + SPACING and y < positions[j][1] + boxes[j][1] + SPACING:
+                found.append((min(i, j), max(i, j)))
+        active.append(i)
+    return found
+
+def spread(boxes, links):
+    # corners of (width, height) boxes that don't overlap, walking the links from the largest box
+    # every box goes where the box it is reached from wants it, or on the free spot nearest to that
+    # links are (a, b, dx, dy), box b wanted at dx, dy from box a
+    neighbours = [[] for b in boxes]
+    for a, b, dx, dy in links:
+        neighbours[a].append((b, dx, dy))
+        neighbours[b].append((a, -dx, -dy))
+    corners = [None]*len(boxes)
+    # placed boxes as (x, y, width, height), hashed on a grid under every cell they and their spacing touch
+    placed = []
+    grid = collections.defaultdict(list)
+    cells = lambda x, y, w, h: [(cx, cy) for cx in range((x - SPACING)//CELL, (x + w + SPACING)//CELL + 1)
+                                for cy in range((y - SPACING)//CELL, (y + h + SPACING)//CELL + 1)]
+    def near(x, y, w, h):
+        return [placed[k] for k in set([k for cell in cells(x, y, w, h) for k in grid[cell]])]
+    def free(x, y, w, h):
+        return all([x + w + SPACING <= px or px + pw + SPACING <= x or y + h + SPACING <= py or py + ph + SPACING <= y
+                    for px, py, pw, ph in near(x, y, w, h)])
+    def nearest(x, y, w, h):
+        # spots touching a placed box around the wanted one, first those in line with it, looking further
+        # away until one is free
+        if free(x, y, w, h): return x, y
+        reach = CELL
+        distance = lambda spot: abs(spot[0] - x) + abs(spot[1] - y)
+        while True:
+            around = near(x - reach, y - reach, w + 2*reach, h + 2*reach)
+            xs = set([px + pw + SPACING for px, py, pw, ph in around] + [px - w - SPACING for px, py, pw, ph in around])
+            ys = set([py + ph + SPACING for px, py, pw, ph in around] + [py - h - SPACING for px, py, pw, ph in around])
+            for spots in ([(cx, y) for cx in xs] + [(x, cy) for cy in ys], [(cx, cy) for cx in xs for cy in ys]):
+                for spot in sorted(spots, key=distance):
+                    if free(spot[0], spot[1], w, h): return spot
+            reach *= 2
+    def add(box):
+        for cell in cells(*box): grid[cell].append(len(placed))
+        placed.append(box)
+    for root in sorted(range(len(boxes)), key=lambda i: -boxes[i][0]*boxes[i][1]):
+        if corners[root] is not None: continue
+        queue = collections.deque([(root, 0, 0)])
+        while len(queue):
+            i, x, y = queue.popleft()
+            if corners[i] is not None: continue
+            corners[i] = nearest(x, y, *boxes[i])
+            add(corners[i] + boxes[i])
+            for j, dx, dy in neighbours[i]:
+                if corners[j] is None: queue.append((j, corners[i][0] + dx, corners[i][1] + dy))
+    return corners
+
+def place(boxes, links, options):
+    # spread() the boxes, then pull linked ones together as far as they can go without overlapping
+    # overlapping pairs are kept apart the way spread() separated them, so the LP stays feasible and the
+    # solver never branches; its difference constraints leave integral corners
+    start = spread(boxes, links)
+    model = Matrix.Model()
+    M = sum([w + h + 2*SPACING for w, h in boxes])
+    corners = [(model.var(x - M, x + M, integer=False), model.var(y - M, y + M, integer=False)) for x, y in start]
+    model.fix(corners[0][0], start[0][0])
+    model.fix(corners[0][1], start[0][1])
+    for a, b, dx, dy in links:
+        for axis, d in ((0, dx), (1, dy)):
+            slack = model.var(0, 2*M, integer=False, cost=1)
+            model.row([(corners[b][axis], 1), (corners[a][axis], -1), (slack, -1)], hi=d)
+            model.row([(corners[b][axis], -1), (corners[a][axis], 1), (slack, -1)], hi=-d)
+
+    options = dict(options)
+    name = options.get('solver')
+    if name == 'auto': name = Solvers.pick(options.get('solvers') or [], len(boxes))
+    backend = Matrix.solver(name if name in Solvers.NAMES else None, options.get('gap', .05), options.get('threads'))
+    done = set()
+    def separate(pairs):
+        for i, j in pairs:
+            # left of, right of, below or above, whichever has the most room in the spread layout
+            rows = [(j, i, 0, boxes[i][0]), (i, j, 0, boxes[j][0]), (j, i, 1, boxes[i][1]), (i, j, 1, boxes[j][1])]
+            hi, lo, axis, size = max(rows, key=lambda r: start[r[0]][r[2]] - start[r[1]][r[2]] - r[3])
+            model.row([(corners[hi][axis], 1), (corners[lo][axis], -1)], lo=size + SPACING)
+        done.update(pairs)
+    # boxes spread() left next to each other are the ones most likely pulled onto each other
+    separate(overlaps([(w + 1, h + 1) for w, h in boxes], start, done))
+    rounds = 0
+    while True:
+        status = backend.solve(model)
+        rounds += 1
+        if status != 'optimal':
+            print('[-] Area placement failed, keeping the spread boxes.')
+            return start
+        positions = [(round(model[x]), round(model[y])) for x, y in corners]
+        violated = overlaps(boxes, positions, done)
+        if not len(violated): break
+        separate(violated)
+    print('[+] Placed %d areas in %d rounds, %d pairs kept apart.'%(len(boxes), rounds, len(done)))
+    base = (min([p[0] for p in positions]), min([p[1] for p in positions]))
+    return [(x - base[0], y - base[1]) for x, y in positions]
+
+def compose(world, layouts, options):
+    # one map of every area: areas linked by exits placed together per group, groups packed side by side
+    paths = [p for p in world.areas if p in layouts and any([not r.dummy for r in layouts[p][0].values()])]
+    index = {p: i for i, p in enumerate(paths)}
+    bounds = [extent([r for r in layouts[p][0].values() if not r.dummy]) for p in paths]
+    boxes = [(b[2], b[3]) for b in bounds]
+
+    # exits into other areas, from the room inside to the room on the other side
+    links = []
+    for a, path in enumerate(paths):
+        rdb, exits = layouts[path]
+        for ex in exits:
+            if not rdb[ex.n_room].dummy or rdb[ex.p_room].dummy or ex.n_room not in world.index: continue
+            other = world.index[ex.n_room][0]
+            if other not in index or other == path or ex.n_room not in layouts[other][0]: continue
+            b = index[other]
+            p, n = rdb[ex.p_room], layouts[other][0][ex.n_room]
+            dx, dy, dz = Mapper.step(ex.direction, ex.distance)
+            links.append((a, b, round(p.x) - bounds[a][0] + dx - (round(n.x) - bounds[b][0]),
+                          round(p.y) - bounds[a][1] + dy - (round(n.y) - bounds[b][1])))
+
+    # groups of areas connected by exits, union-find as over rooms
+    parent = list(range(len(paths)))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    for a, b, dx, dy in links:
+        parent[find(a)] = find(b)
+    groups = {}
+    for i in range(len(paths)): groups.setdefault(find(i), []).append(i)
+    groups = sorted(groups.values(), key=lambda g: (-len(g), g[0]))
+    print('[+] %d areas with %d exits between them in %d groups.'%(len(paths), len(links), len(groups)))
+
+    corners = [None]*len(paths)
+    for group in groups:
+        local = {i: k for k, i in enumerate(group)}
+        inside = [(local[a], local[b], dx, dy) for a, b, dx, dy in links if a in local]
+        placed = place([boxes[i] for i in group], inside, options) if len(group) > 1 else [(0, 0)]
+        for i, corner in zip(group, placed): corners[i] = corner
+    shifts = pack([(min([corners[i][0] for i in g]), min([corners[i][1] for i in g]),
+                    max([corners[i][0] + boxes[i][0] for i in g]) - min([corners[i][0] for i in g]),
+                    max([corners[i][1] + boxes[i][1] for i in g]) - min([corners[i][1] for i in g])) for g in groups])
+
+    # rooms moved with their area, dummies only stay for exits that lead nowhere on the map
+    rdb, dummies, exits = {}, {}, set()
+    for group, (sx, sy) in zip(groups, shifts):
+        for i in group:
+            dx, dy = corners[i][0] - bounds[i][0] + sx, corners[i][1] - bounds[i][1] + sy
+            area, area_exits = layouts[paths[i]]
+            for r in area.values():
+                r.x, r.y = r.x + dx, r.y + dy
+                (dummies if r.dummy else rdb)[r.vnum] = r
+            exits.update(area_exits)
+    for vnum, r in dummies.items():
+        if vnum not in rdb: rdb[vnum] = r
+    exits = list(exits)
+    # exits between areas led out of their own area, the world's room graph knows which way they run
+    Mapper.mark_one_ways(world.graph(), [ex for ex in exits if ex.p_room in rdb and ex.n_room in rdb])
+    x_min = min([r.x for r in rdb.values()])
+    y_min = min([r.y for r in rdb.values()])
+    for r in rdb.values():
+        r.x -= x_min
+        r.y -= y_min
+    return rdb, exits
+
+def main():
+    cli = argparse.ArgumentParser(description='Lay out every area of a world on its own and put them on one map.')
+    cli.add_argument('world', help='directory of area files')
+    cli.add_argument('output', help='svg file of the whole world')
+    Mapper.arguments(cli)
+    args = cli.parse_args()
+    options, cache, plotter = Mapper.settings(cli, args)
+
+    compiled = AreaParser.Compiled(args.area_cache) if args.area_cache else None
+    world = World.World.load(args.world, args.jobs, args.parser, compiled)
+
+    # first level: every area as Mapper lays it out, with where its exits lead
+    jobs = []
+    for path, rooms in world.rooms.items():
+        if not len(rooms) or world.areas[path] is None: continue
+        rooms = [r for i, r in enumerate(rooms) if world.index[r[0]] == (path, i)]
+        outside = {target: (world.room(target)[1], owner[1]) for vnum, d, target, owner in world.crossings(path)
+                   if owner is not None}
+        jobs.append((path, world.areas[path], rooms, outside, options, args.engine, args.decompose, cache,
+                     args.incremental))
+    jobs.sort(key=lambda job: -len(job[2]))
+    layouts = {}
+    if args.jobs > 1:
+        with multiprocessing.Pool(args.jobs) as pool:
+            for path, rdb, exits, log in pool.imap_unordered(lay_out, jobs):
+                print(log, end='')
+                layouts[path] = (rdb, exits)
+    else:
+        for job in jobs:
+            path, rdb, exits, log = lay_out(job)
+            print(log, end='')
+            layouts[path] = (rdb, exits)
+
+    # second level: the areas as boxes
+    rdb, exits = compose(world, layouts, options)
+    print('[+] World map of %d rooms. Plotting...'%(len([r for r in rdb.values() if not r.dummy])))
+    if args.export:
+        Render.write_layout(os.path.splitext(args.output)[0] + Render.LAYOUT_EXT, None, rdb, exits)
+    plotter(args.output, rdb, exits).plot()
+
+if __name__=='__main__':
+    main()
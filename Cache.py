@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+import os
+import json
+import hashlib
+import tempfile
+
+def key(*parts):
+    # content address of anything json can represent canonically
+    blob = json.dumps(parts, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+class LayoutCache():
+    # solved room positions on disk, one file per key, evicted least recently used first
+    # only layouts solved to optimality are put, one cut short by the time limit is solved again next run
+    # file mtimes double as the recency record, a hit touches its entry
+    # the last layout of every output is kept as well for incremental re-layout
+    def __init__(self, path, limit=64*1024*1024):
+        self.path = path
+        self.limit = limit
+        os.makedirs(path, exist_ok=True)
+
+    def entry(self, key):
+        return os.path.join(self.path, key+'.json')
+
+    def get(self, key):
+        try:
+            with open(self.entry(key), 'r') as f:
+                positions = {int(r[0]): tuple(r[1:]) for r in json.load(f)}
+            os.utime(self.entry(key))
+        except (OSError, ValueError):
+            return None
+        return positions
+
+    def put(self, key, positions):
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump([[vnum]+list(p) for vnum, p in sorted(positions.items())], f)
+        os.replace(tmp, self.entry(key))
+        self.evict()
+
+    def last(self, vnum):
+        return os.path.join(self.path, key('last', vnum)+'.last')
+
+    def recall(self, vnums):
+        # last layout written for a component, found through any of its rooms whatever its content was
+        for vnum in sorted(vnums):
+            try:
+                with open(self.last(vnum), 'r') as f:
+                    return {int(r[0]): (tuple(r[1:4]), r[4]) for r in json.load(f)}
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError):
+                return None
+        return None
+
+    def remember(self, vnums, positions, signatures):
+        # filed under the lowest room of the component
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump([[vnum]+list(p)+[signatures[vnum]] for vnum, p in sorted(positions.items())], f)
+        os.replace(tmp, self.last(min(vnums)))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(('.json', '.last')): continue
+            try:
+                st = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        total = sum([e[1] for e in entries])
+        for mtime, size, name in sorted(entries):
+            if total <= self.limit: break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+            total -= size
@@ -1,191 +1,551 @@
 #!/usr/bin/env python
 
-import sys
 import os
-import enum
+import argparse
+import time
 import itertools
+import collections
+import io
+import contextlib
+import multiprocessing
 
-import svgwrite
-from svgwrite import cm
 import pyomo.opt
 from pyomo.environ import *
 
 import AreaParser
+import Overlap
+import Cache
+import World
+import RoomGraph
+import Matrix
+import Solvers
+import Render
+from Render import Direction, direction_matrix, Room, Exit, Plotter, step
 
-class Direction(enum.IntEnum):
-    north=0
-    east=1
-    up=2
-    south=3
-    west=4
-    down=5
-    mod=6
-    def invert(self):
-        return Direction((self + self.mod/2)%self.mod)
-
-direction_matrix = [Direction.north,
-                    Direction.east,
-                    Direction.south,
-                    Direction.west,
-                    Direction.up,
-                    Direction.down]
-
-class Room():
-    def __init__(self, r):
-        self.vnum = r[0]
-        self.name = r[1]
-        self.desc = r[2]
-        self.exits = [] if not r[3] else [Exit(e, self.vnum) for e in r[3] if e is not None]
-        self.fixups = []
-        self.dummy = False
-
-    def replace_exit(self, orig, replacement, distance):
-        for e in self.exits:
-            if e.n_room == orig:
-                e.n_room = replacement
-                e.distance += distance
-
-    def __repr__(self):
-        return '[%d: %s] {%s}'%(self.vnum, self.name, self.exits)
-            
-class Exit():
-    def __init__(self, e, source, fake=False, distance=1):
-        self.p_room = source
-        self.n_room = e[1]
-        self.direction = Direction(direction_matrix[e[0]])
-        self.distance = distance
-        self.one_way = False
-
-    def __eq__(self, e):
-        if self.p_room == e.p_room and self.n_room == e.n_room and \
-           self.direction == e.direction: return True
-        if self.p_room == e.n_room and self.n_room == e.p_room and \
-           self.direction == e.direction.invert(): return True
-        return False
-
-    def __contains__(self, e):
-        return e in (self.p_room, self.n_room)
-
-    def __repr__(self):
-        return '%d -> %d (%d %s)'%(self.p_room, self.n_room, self.distance, self.direction.name)
-
-    def __hash__(self):
-        r0, r1, d = (self.p_room, self.n_room, self.direction) if self.p_room < self.n_room \
-            else (self.n_room, self.p_room, self.direction.invert())
-        return hash('%d %d %d'%(r0, r1, d))
-
-class Plotter():
-    lift = 0.15
-    colors = ['red', 'orange', 'yellow', 'green', 'blue', 'indigo', 'violet']
-
-    def proj_room(self, room):
-        if None in (room.x, room.y, room.z): return None
-        return (2 + room.x + self.lift*room.z,
-                2+self.lift*self.z_max + (self.y_max - room.y) - self.lift*room.z)
-
-    def proj_exit(self, ex):
-        if None in (self.rdb[ex.p_room].x, self.rdb[ex.p_room].y, self.rdb[ex.p_room].z): return None
-        start = (2 + self.rdb[ex.p_room].x + .25 + self.lift*self.rdb[ex.p_room].z,
-                 2+self.lift*self.z_max + (self.y_max - self.rdb[ex.p_room].y) + .25 - self.lift*self.rdb[ex.p_room].z)
-
-        if ex.n_room in self.rdb.keys():
-            if None in (self.rdb[ex.n_room].x, self.rdb[ex.n_room].y, self.rdb[ex.n_room].z): return None
-            end = (2 + self.rdb[ex.n_room].x + .25 + self.lift*self.rdb[ex.n_room].z,
-                   2+self.lift*self.z_max + (self.y_max - self.rdb[ex.n_room].y) + .25 - self.lift*self.rdb[ex.n_room].z)
-        else:
-            if ex.direction == Direction.north:
-                end = (start[0], start[1]-1)
-            elif ex.direction == Direction.east:
-                end = (start[0]+1, start[1])
-            elif ex.direction == Direction.south:
-                end = (start[0], start[1]+1)
-            elif ex.direction == Direction.west:
-                end = (start[0]-1, start[1])
-            elif ex.direction == Direction.up:
-                end = (start[0]+self.lift, start[1]-self.lift)
-            elif ex.direction == Direction.down:
-                end = (start[0]-self.lift, start[1]+self.lift)
-
-        return (start, end)
-
-    def __init__(self, name, rdb, exits):
-        self.name = name
-        self.rdb = rdb
-        self.exits = exits
-
-    def plot(self):
-        self.x_max = max([r.x for r in self.rdb.values()])
-        self.y_max = max([r.y for r in self.rdb.values()])
-        self.z_max = max([r.y for r in self.rdb.values()])
-        z_space = self.z_max*self.lift
-
-        dwg = svgwrite.Drawing(self.name, profile='full',
-                               size=((self.x_max+4+11+z_space)*cm, (self.y_max+4+4+z_space)*cm),
-                               viewBox='0 0 %d %d'%(self.x_max+4+11+z_space, self.y_max+4+4+z_space))
-
-        exits = sorted(self.exits, key=lambda x: max(self.rdb[x.p_room].z, self.rdb[x.n_room].z))
-        rooms = sorted(self.rdb.values(), key=lambda r: r.z)
-        descs = []
-
-        while len(exits) or len(rooms):
-            e = self.rdb[exits[0].p_room].z if len(exits) else None
-            r = rooms[0].z if len(rooms) else None
-            if e is not None and (r is None or r >= e):
-                ex = exits.pop(0)
-                projection = self.proj_exit(ex)
-                color = 'red' if ex.one_way else 'black'
-                dwg.add(dwg.line(start=projection[0], end=projection[1], stroke_width=.05, stroke=color))
+def materialize(g, members=None):
+    # Room and Exit objects for some (default all) rooms of a RoomGraph, read off its arrays
+    # exits leading out of the rooms are one-ways, the dummy rooms standing in for their ends have no way back
+    rdb = {}
+    made = {}
+    for i in range(len(g)) if members is None else members:
+        room = Room((g.vnums[i], g.names[i], g.descs[i], None))
+        room.exits = [Exit((g.direction[e], g.vnums_out[e]), room.vnum, distance=g.distance[e]) for e in g.exits(i)]
+        for e, ex in zip(g.exits(i), room.exits):
+            ex.one_way = bool(g.flags[e] & (RoomGraph.ONE_WAY | RoomGraph.OUTSIDE))
+            made[e] = ex
+        rdb[room.vnum] = room
+    for e, ex in made.items():
+        ex.reverse = made.get(g.reverse[e])
+    return rdb
+
+def entering(rdb):
+    # number of exits leading into every room from the rooms in rdb
+    return collections.Counter([e.n_room for r in rdb.values() for e in r.exits])
+
+def straight(rdb, room, entered):
+    # a room only passed through, two bidirectional exits running opposite ways to two other rooms
+    # and no other exit leading into it, which would be left pointing at a room taken out of the model
+    if room.dummy or len(room.exits) != 2 or entered[room.vnum] != 2: return False
+    a, b = room.exits
+    if a.n_room == b.n_room or room.vnum in (a.n_room, b.n_room): return False
+    if not all([e.n_room in rdb and e.reverse is not None for e in room.exits]): return False
+    return a.direction == b.direction.invert()
+
+def contract(rdb, area):
+    # replace every run of straight rooms by one exit between the rooms at its ends
+    contracted = 0
+    # joining the ends of a chain takes one exit into each end away and adds another
+    entered = entering(rdb)
+    for vnum in list(rdb.keys()):
+        if vnum not in rdb or not straight(rdb, rdb[vnum], entered): continue
+        # walk out both ways to the ends of the chain
+        ends = []
+        for e in rdb[vnum].exits:
+            path, prev, cur = [], vnum, e.n_room
+            while cur != vnum and straight(rdb, rdb[cur], entered):
+                path.append(cur)
+                prev, cur = cur, [x.n_room for x in rdb[cur].exits if x.n_room != prev][0]
+            ends.append((path, cur))
+        (back, a), (ahead, b) = ends
+        if a == b or vnum in (a, b): continue
+        chain = back[::-1] + [vnum] + ahead
+
+        # interior rooms are fixed up relative to the end they start from, at the distances along the chain
+        d = [e.direction for e in rdb[a].exits if e.n_room == chain[0]][0]
+        dist, total = 0, 0
+        prev = a
+        for c in chain:
+            dist += [e.distance for e in rdb[c].exits if e.n_room == prev][0]
+            rdb[a].fixups.append((rdb[c], d, dist, False))
+            prev = c
+        total = dist + [e.distance for e in rdb[chain[-1]].exits if e.n_room == b][0]
+        a_step = [e.distance for e in rdb[a].exits if e.n_room == chain[0]][0]
+        b_step = [e.distance for e in rdb[b].exits if e.n_room == chain[-1]][0]
+        ahead = [e.reverse for e in rdb[chain[0]].exits if e.n_room == a][0]
+        behind = [e.reverse for e in rdb[chain[-1]].exits if e.n_room == b][0]
+        rdb[a].replace_exit(chain[0], b, total - a_step)
+        rdb[b].replace_exit(chain[-1], a, total - b_step)
+        ahead.reverse, behind.reverse = behind, ahead
+        # ends already joined by another exit become a maze, as RoomGraph.link() would flag them
+        for p, n in ((a, b), (b, a)):
+            between = [e for e in rdb[p].exits if e.n_room == n]
+            if len(between) > 1:
+                for e in between: e.one_way = True
+        for c in chain: del rdb[c]
+        contracted += len(chain)
+        print('%s [*] Contracted %d rooms between %d and %d.'%(area[1], len(chain), a, b))
+    return contracted
+
+def prune(rdb, area, pruned, keep=()):
+    # remove dead ends one by one, so whole pendant trees fold into the room they hang off
+    # rooms in keep stay in the model, and so do dead ends other rooms lead into besides their holder
+    # removing a dead end doesn't change which of the remaining exits are one-ways
+    removed = 0
+    entered = entering(rdb)
+    queue = collections.deque([vnum for vnum, r in rdb.items() if len(r.exits) == 1])
+    while len(queue):
+        vnum = queue.popleft()
+        if vnum not in rdb: continue
+        leaf = rdb[vnum]
+        if len(leaf.exits) != 1 or vnum in keep: continue
+        ex = leaf.exits[0]
+        if ex.n_room == vnum or ex.n_room not in rdb or ex.one_way or entered[vnum] != 1: continue
+        holder = rdb[ex.n_room]
+        back = ex.reverse
+        holder.exits.remove(back)
+        holder.fixups.append((leaf, back.direction, back.distance, True))
+        pruned.append((holder.vnum, back))
+        del rdb[vnum]
+        entered[holder.vnum] -= 1
+        removed += 1
+        if len(holder.exits) == 1: queue.append(holder.vnum)
+    if removed: print('%s [*] Pruned %d dead end rooms.'%(area[1], removed))
+    return removed
+
+def merge(rdb, area, pruned):
+    # rooms of a maze with the same exits to the same rooms only add soft terms to the model,
+    # one of them is solved for and the others are put on the nearest free spot above it
+    twins = collections.defaultdict(list)
+    incoming = collections.defaultdict(list)
+    for vnum, r in rdb.items():
+        for e in r.exits: incoming[e.n_room].append(e)
+        if len(r.exits):
+            twins[tuple(sorted([(e.direction, e.n_room, e.distance) for e in r.exits]))].append(vnum)
+    removed = 0
+    for group in twins.values():
+        if len(group) < 2: continue
+        for vnum in group[1:]:
+            r = rdb[vnum]
+            edges = r.exits + incoming[vnum]
+            if any([e.n_room in group for e in r.exits]): continue
+            if not all([e.p_room in rdb and e.n_room in rdb and e.one_way for e in edges]): continue
+            for e in incoming[vnum]:
+                if e in rdb[e.p_room].exits:
+                    rdb[e.p_room].exits.remove(e)
+                    pruned.append((e.p_room, e))
+            for e in r.exits: pruned.append((vnum, e))
+            r.exits = []
+            rdb[group[0]].fixups.append((r, None, 0, True))
+            del rdb[vnum]
+            removed += 1
+    if removed: print('%s [*] Merged %d maze rooms into their twins.'%(area[1], removed))
+    return removed
+
+def simplify(rdb, area, keep=()):
+    # shrink the graph handed to the solver until nothing more can be taken out
+    # removed rooms become fixups of a remaining room, see restore_rooms
+    # returns the (room, exit) pairs taken off remaining rooms, which are put back for plotting
+    pruned = []
+    while contract(rdb, area) + prune(rdb, area, pruned, keep) + merge(rdb, area, pruned): pass
+    return pruned
+
+def restore_rooms(rdb):
+    # place the rooms simplify removed around the solved ones
+    # chain rooms go exactly where they were contracted, dead ends are stretched away from their room
+    # until their exit runs clear of placed rooms and exits, and twins go on the first free spot above theirs
+    # returns the rooms placed and the dead ends no stretch could keep off the rest of the layout
+    restored, tangled = [], []
+    occupied = set([(r.x, r.y, r.z) for r in rdb.values()])
+    lo = [min([p[axis] for p in occupied]) for axis in range(3)]
+    hi = [max([p[axis] for p in occupied]) for axis in range(3)]
+    # the exits the solver kept apart, restored dead ends join them as they are placed
+    drawn = Overlap.Index()
+    for room in rdb.values():
+        for ex in room.exits:
+            if ex.one_way or ex.n_room == ex.p_room or ex.n_room not in rdb: continue
+            n = rdb[ex.n_room]
+            drawn.add((room.x, room.y, room.z), (n.x, n.y, n.z))
+    exact, loose = collections.deque(), collections.deque()
+    def schedule(room):
+        for fixup in room.fixups:
+            (loose if fixup[3] else exact).append((room, fixup))
+    for room in list(rdb.values()): schedule(room)
+
+    while len(exact) or len(loose):
+        holder, (r, d, dist, stretch) = exact.popleft() if len(exact) else loose.popleft()
+        origin = (holder.x, holder.y, holder.z)
+        twin = d is None
+        if twin:
+            d, dist = Direction.up, 1
+        # past reach the exit ends beyond everything placed, stretching further can't clear it
+        axis, sign = [(axis, s) for axis, s in enumerate(step(d, 1)) if s][0]
+        reach = max(0, (hi[axis] - origin[axis] if sign > 0 else origin[axis] - lo[axis]) + 1 - dist)
+        extra, fallback = 0, None
+        while stretch:
+            path = [tuple(origin[axis] + s[axis] for axis in range(3)) for s in
+                    (step(d, k) for k in range(1, dist+extra+1))]
+            blocked = any([pos in occupied for pos in path])
+            if not blocked and (twin or not drawn.hits(path[0], path[-1])): break
+            # a room in the way of the exit itself can't be stepped over, settle for a free spot
+            stuck = any([pos in occupied for pos in path[:dist]])
+            if fallback is None and path[-1] not in occupied and (stuck or not blocked): fallback = extra
+            if fallback is not None and (stuck or extra >= reach):
+                extra = fallback
+                if not twin: tangled.append(r.vnum)
+                break
+            extra += 1
+        r.x, r.y, r.z = (origin[axis] + s for axis, s in enumerate(step(d, dist+extra)))
+        occupied.add((r.x, r.y, r.z))
+        lo = [min(lo[axis], p) for axis, p in enumerate((r.x, r.y, r.z))]
+        hi = [max(hi[axis], p) for axis, p in enumerate((r.x, r.y, r.z))]
+        if stretch and not twin: drawn.add(origin, (r.x, r.y, r.z))
+        rdb[r.vnum] = r
+        restored.append(r.vnum)
+        schedule(r)
+    return restored, tangled
+
+def mark_one_ways(g, exits):
+    # one-way flags of exits as a RoomGraph spanning more rooms has them, exits it doesn't hold keep theirs
+    for ex in exits:
+        if ex.p_room not in g.index: continue
+        for e in g.exits(g.index[ex.p_room]):
+            if g.vnums_out[e] == ex.n_room and direction_matrix[g.direction[e]] == ex.direction:
+                ex.one_way = bool(g.flags[e] & (RoomGraph.ONE_WAY | RoomGraph.OUTSIDE))
+
+def propagate(rdb, exits):
+    # constructive layout: walk the exits breadth first and place each room one step from where it was reached
+    neighbours = {vnum: [] for vnum in rdb}
+    for ex in exits:
+        dx, dy, dz = step(ex.direction, ex.distance)
+        neighbours[ex.p_room].append((ex.n_room, (dx, dy, dz), ex))
+        neighbours[ex.n_room].append((ex.p_room, (-dx, -dy, -dz), ex))
+
+    positions = {}
+    x_max = 0
+    for root in rdb:
+        if root in positions: continue
+        # lay out each separately reachable piece to the east of the previous ones
+        positions[root] = (x_max + 2 if len(positions) else 0, 0, 0)
+        queue = collections.deque([root])
+        pending = collections.deque()
+        while len(queue) or len(pending):
+            if not len(queue):
+                # rooms only reachable through one-ways are placed last
+                n, pos = pending.popleft()
+                if n in positions: continue
+                positions[n] = pos
+                queue.append(n)
+            vnum = queue.popleft()
+            x, y, z = positions[vnum]
+            for n, (dx, dy, dz), ex in neighbours[vnum]:
+                pos = (x+dx, y+dy, z+dz)
+                if ex.one_way:
+                    pending.append((n, pos))
+                elif n not in positions:
+                    positions[n] = pos
+                    queue.append(n)
+        x_max = max([p[0] for p in positions.values()])
+
+    return positions
+
+def find_conflicts(rdb, exits, positions):
+    # rooms whose placement contradicts an exit or collides with another room
+    conflicts = set()
+
+    # exits that don't run in their direction for at least their distance (inconsistent cycles)
+    for ex in exits:
+        if ex.one_way or ex.n_room == ex.p_room: continue
+        delta = tuple(positions[ex.n_room][axis] - positions[ex.p_room][axis] for axis in range(3))
+        unit = step(ex.direction, 1)
+        length = sum([d*u for d, u in zip(delta, unit)])
+        if length < ex.distance or tuple(u*length for u in unit) != delta:
+            conflicts.update((ex.p_room, ex.n_room))
+
+    # rooms sharing a spot
+    occupied = collections.defaultdict(list)
+    for vnum, pos in positions.items():
+        occupied[pos].append(vnum)
+    for rooms in occupied.values():
+        if len(rooms) > 1: conflicts.update(rooms)
+
+    # exits running through each other
+    considered = [ex for ex in exits if not ex.one_way and ex.n_room != ex.p_room]
+    rooms = list(rdb.keys())
+    index = {vnum: i for i, vnum in enumerate(rooms)}
+    detector = Overlap.Detector([(index[ex.p_room], index[ex.n_room]) for ex in considered])
+    xs, ys, zs = ([positions[vnum][axis] for vnum in rooms] for axis in range(3))
+    for depth, i, j in detector.collisions(xs, ys, zs):
+        conflicts.update((considered[i].p_room, considered[i].n_room, considered[j].p_room, considered[j].n_room))
+
+    return conflicts
+
+def blocks(rdb, exits):
+    # biconnected components of the room graph as lists of exits, bridges come out as single exits
+    adjacency = {vnum: [] for vnum in rdb}
+    for i, ex in enumerate(exits):
+        if ex.p_room == ex.n_room: continue
+        adjacency[ex.p_room].append((ex.n_room, i))
+        adjacency[ex.n_room].append((ex.p_room, i))
+
+    depth, low = {}, {}
+    found = []
+    for root in rdb:
+        if root in depth: continue
+        depth[root] = low[root] = 0
+        stack = [(root, None, iter(adjacency[root]))]
+        edges = []
+        while len(stack):
+            vnum, via, it = stack[-1]
+            for n, i in it:
+                if i == via: continue
+                if n not in depth:
+                    depth[n] = low[n] = depth[vnum] + 1
+                    edges.append(i)
+                    stack.append((n, i, iter(adjacency[n])))
+                    break
+                elif depth[n] < depth[vnum]:
+                    low[vnum] = min(low[vnum], depth[n])
+                    edges.append(i)
             else:
-                room = rooms.pop(0)
-                if room.dummy: continue
-                projection = self.proj_room(room)
-                g = dwg.g(visibility='hidden')
-                etext = 'Exits: ' + ', '.join([ex.direction.name for ex in room.exits])
-                desc = room.desc.split('\n')+[etext]
-                g.add(dwg.rect(fill='white', insert=(projection[0]+.5, projection[1]+.5), size=(11,2+len(desc)/3),
-                               stroke='black', stroke_width=0.05))
-                text = dwg.text('', insert=(projection[0]+.7, projection[1]+1.1), #size=(100,100),
-                                font_size='.3', font_family='Arial', fill='black')
-                text.add(dwg.tspan(room.name, font_size='.4'))
-                for line in desc:
-                    text.add(dwg.tspan(line, x=[projection[0]+.7], dy=['1.4em']))
-                g.add(text)
-                r = dwg.rect(insert=projection, size=(.5,.5),
-                             fill=self.colors[min(6, int(room.z))], stroke='black', stroke_width=0.025)
-                s = dwg.set(to='visible')
-                s.set_target('visibility')
-                s.set_timing(begin=r.get_id()+'.mouseover', end=r.get_id()+'.mouseout')
-                g.add(s)
-                dwg.add(r)
-                descs.append(g)
-
-        # add these after so they float above
-        for g in descs: dwg.add(g)
-
-        dwg.save()
-        return
-
-def restore_rooms(room):
-    rooms = []
-    for r, d, dist in room.fixups:
-        r.x, r.y, r.z = room.x, room.y, room.z
-        if d == Direction.north:
-            r.y += dist
-        elif d == Direction.east:
-            r.x += dist
-        elif d == Direction.south:
-            r.y -= dist
-        elif d == Direction.west:
-            r.x -= dist
-        elif d == Direction.up:
-            r.z += dist
-        elif d == Direction.down:
-            r.z -= dist
-        rooms.append(r)
-        rooms += restore_rooms(r)
-    return rooms
-
-def solve(rdb, exits):
+                stack.pop()
+                if not len(stack): continue
+                parent = stack[-1][0]
+                low[parent] = min(low[parent], low[vnum])
+                if low[vnum] >= depth[parent]:
+                    # parent is an articulation room (or the root), everything above via is one block
+                    block = []
+                    while True:
+                        i = edges.pop()
+                        block.append(exits[i])
+                        if i == via: break
+                    found.append(block)
+    return found
+
+def stitch(rdb, exits, area, options, engine):
+    # lay out every block on its own and stitch them back together at their articulation rooms
+    # the status is optimal only when every block solved to optimality
+    parts = blocks(rdb, exits)
+    if not len(parts): return {vnum: (0, 0, 0) for vnum in rdb}, pyomo.opt.TerminationCondition.optimal
+    print('%s [+] Decomposed into %d blocks, %d bridges.'%(area[1], len(parts), len([p for p in parts if len(p) == 1])))
+
+    layouts = []
+    status = pyomo.opt.TerminationCondition.optimal
+    membership = collections.defaultdict(list)
+    for b, part in enumerate(parts):
+        rooms = set([v for ex in part for v in (ex.p_room, ex.n_room)])
+        for vnum in rooms: membership[vnum].append(b)
+        if len(part) == 1:
+            # tree branches don't need a solver
+            ex = part[0]
+            layouts.append({ex.p_room: (0, 0, 0), ex.n_room: step(ex.direction, ex.distance)})
+        else:
+            positions, solved = layout({vnum: rdb[vnum] for vnum in rooms}, list(part), area, options, engine)
+            if solved != pyomo.opt.TerminationCondition.optimal: status = solved
+            layouts.append({vnum: tuple(round(v) for v in p) for vnum, p in positions.items()})
+
+    # walk the block tree from the largest block, shifting each block onto its articulation room
+    first = max(range(len(parts)), key=lambda b: len(layouts[b]))
+    positions = dict(layouts[first])
+    occupied = set(positions.values())
+    placed = set([first])
+    queue = collections.deque([first])
+    while len(queue):
+        for a in layouts[queue.popleft()]:
+            for b in membership[a]:
+                if b in placed: continue
+                placed.add(b)
+                queue.append(b)
+                offset = tuple(positions[a][axis] - layouts[b][a][axis] for axis in range(3))
+                if len(parts[b]) == 1:
+                    # bridges can be stretched until the room beyond them lands on a free spot
+                    ex = parts[b][0]
+                    d = ex.direction if ex.p_room == a else ex.direction.invert()
+                    for extra in range(len(rdb)):
+                        path = [tuple(positions[a][axis] + s[axis] for axis in range(3))
+                                for s in (step(d, k) for k in range(1, ex.distance+extra+1))]
+                        if not any([pos in occupied for pos in path]):
+                            offset = tuple(offset[axis] + s for axis, s in enumerate(step(d, extra)))
+                            break
+                for vnum, p in layouts[b].items():
+                    if vnum in positions: continue
+                    positions[vnum] = tuple(p[axis] + offset[axis] for axis in range(3))
+                    occupied.add(positions[vnum])
+
+    # rooms outside every block, i.e. a component of a single room
+    for vnum in rdb:
+        if vnum not in positions: positions[vnum] = (0, 0, 0)
+
+    return positions, status
+
+def shifted(positions):
+    # move a layout into the non-negative range the model uses
+    base = [min([p[axis] for p in positions.values()]) for axis in range(3)]
+    return {vnum: tuple(p[axis] - base[axis] for axis in range(3)) for vnum, p in positions.items()}
+
+def resolve(rdb, exits, positions, area, options, status=pyomo.opt.TerminationCondition.optimal):
+    # hand only conflicting rooms and their neighbours in a precomputed layout to the solver
+    # status is how the precomputed layout was solved, kept when nothing is in conflict
+    conflicts = find_conflicts(rdb, exits, positions)
+    print('%s [+] Layout placed %d rooms, %d in conflict.'%(area[1], len(positions), len(conflicts)))
+    if not len(conflicts): return positions, status
+    if options.get('deadline') is not None and time.time() >= options['deadline']:
+        print('%s [-] No time left to resolve conflicts, keeping the layout as placed.'%(area[1]))
+        return positions, pyomo.opt.TerminationCondition.maxTimeLimit
+
+    free = set(conflicts)
+    for ex in exits:
+        if ex.p_room in conflicts or ex.n_room in conflicts:
+            free.update((ex.p_room, ex.n_room))
+    fixed = {vnum: p for vnum, p in shifted(positions).items() if vnum not in free}
+    positions, solved = settle(rdb, exits, area, options, fixed)
+    return positions, solved if status == pyomo.opt.TerminationCondition.optimal else status
+
+def settle(rdb, exits, area, options, fixed={}):
+    # positions of the rooms and the termination condition of the solve that placed them
+    # a deadline in options ends the time budget of the component, each solve gets what is left of it
+    print('%s [+] Solving for %d exits, %d rooms fixed...'%(area[1], len(exits), len(fixed)))
+    options = dict(options)
+    run = solve_sparse if options.pop('model', 'pyomo') == 'sparse' else solve
+    deadline = options.pop('deadline', None)
+    remaining = lambda: None if deadline is None else max(0, deadline - time.time())
+    table = options.pop('solvers', None)
+    if options.get('solver') == 'auto':
+        options['solver'] = Solvers.pick(table or [], len(rdb))
+        print('%s [+] Benchmark picked %s for %d rooms.'%(area[1], options['solver'], len(rdb)))
+    # running out of time is no failure, the solve keeps the best layout it found by then
+    solved = (pyomo.opt.TerminationCondition.optimal, pyomo.opt.TerminationCondition.maxTimeLimit)
+    if deadline is not None: options['time_limit'] = remaining()
+    model, results = run(rdb, exits, fixed=fixed, **options)
+    if len(fixed) and results.solver.termination_condition not in solved:
+        print('%s [-] Partial solve failed, freeing all rooms...'%(area[1]))
+        if deadline is not None: options['time_limit'] = remaining()
+        model, results = run(rdb, exits, **options)
+    if results.solver.termination_condition not in solved:
+        print('%s [-] Solver failed!%s' %(area[1], str(results.solver)))
+    elif results.solver.termination_condition == pyomo.opt.TerminationCondition.maxTimeLimit:
+        print('%s [-] Solve stopped at the time limit, keeping the best layout found.'%(area[1]))
+    else:
+        print('%s [+] Solve completed.'%(area[1]))
+    return {vnum: (round(model.x[vnum].value or 0), round(model.y[vnum].value or 0), round(model.z[vnum].value or 0))
+            for vnum in rdb}, results.solver.termination_condition
+
+def exit_signatures(rdb, exits):
+    # short digest of every exit touching a room, to tell which rooms changed between revisions
+    touching = {vnum: [] for vnum in rdb}
+    for e in exits:
+        for vnum in set((e.p_room, e.n_room)):
+            touching[vnum].append(e.key())
+    return {vnum: Cache.key(sorted(t))[:16] for vnum, t in touching.items()}
+
+def relayout(rdb, exits, previous, signatures, area, options):
+    # keep unchanged rooms where they were and only solve for changed rooms and their neighbours
+    changed = set([vnum for vnum in rdb if vnum not in previous or previous[vnum][1] != signatures[vnum]])
+    if len(changed) == len(rdb): return None
+    free = set(changed)
+    for ex in exits:
+        if ex.p_room in changed or ex.n_room in changed:
+            free.update((ex.p_room, ex.n_room))
+    print('%s [+] Incremental layout, %d rooms changed, %d freed.'%(area[1], len(changed), len(free)))
+    fixed = {vnum: previous[vnum][0] for vnum in rdb if vnum not in free}
+    return settle(rdb, exits, area, options, fixed)
+
+def layout(rdb, exits, area, options, engine):
+    # greedy placement only leaves conflicts to the solver
+    if engine == 'greedy':
+        return resolve(rdb, exits, propagate(rdb, exits), area, options)
+    return settle(rdb, exits, area, options)
+
+def equal_classes(rdb, pairs):
+    # union-find of rooms that have to share a coordinate, numbered densely in room order
+    parent = {vnum: vnum for vnum in rdb}
+    def find(v):
+        while parent[v] != v:
+            parent[v] = parent[parent[v]]
+            v = parent[v]
+        return v
+    for p, n in pairs:
+        a, b = find(p), find(n)
+        if a != b: parent[b] = a
+    numbers = {}
+    return {vnum: numbers.setdefault(find(vnum), len(numbers)) for vnum in rdb}
+
+def big_m(model, lo, hi):
+    # lo - hi >= d_min holds off its relation once M covers d_min + hi - lo at their widest, never more than model.M
+    low = lo.value if lo.fixed else lo.lb
+    high = hi.value if hi.fixed else hi.ub
+    return min(max(0, value(model.d_min) + high - low), value(model.M))
+
+def tighten(classes, order, M, pins):
+    # bounds on class coordinates implied by the box [0, M] and by exits forcing one class past another
+    # order holds (lo, hi, gap) for coordinate[hi] >= coordinate[lo] + gap; pins are fixed coordinates
+    lb = [pins.get(c, 0) for c in range(classes)]
+    ub = [pins.get(c, M) for c in range(classes)]
+    for _ in range(classes):
+        changed = False
+        for lo, hi, gap in order:
+            if lb[lo] + gap > lb[hi]:
+                lb[hi] = lb[lo] + gap
+                changed = True
+            if ub[hi] - gap < ub[lo]:
+                ub[lo] = ub[hi] - gap
+                changed = True
+        if not changed: break
+    return lb, ub
+
+def add_crossing(model, pair, index):
+    # disjunction forcing the rooms of one exit to lie beyond the rooms of the other in some direction
+    # returns (None, []) without adding anything when no direction can hold
+    ex, nx = pair
+    pairs = list(itertools.product((ex.p_room, ex.n_room), (nx.p_room, nx.n_room)))
+    # rooms sharing a coordinate class can't be apart along that axis, those relations are ruled out
+    apart = {Direction.north: model.y, Direction.east: model.x, Direction.south: model.y,
+             Direction.west: model.x, Direction.up: model.z, Direction.down: model.z}
+    ruled_out = [d for d, var in apart.items() if any([var[p] is var[n] for p, n in pairs])]
+    if len(ruled_out) == Direction.mod: return None, []
+
+    relation = Var(model.Directions, within=Boolean)
+    model.add_component('relation%d'%(index), relation)
+    constraints = [model.crossings.add(sum([relation[i] for i in range(Direction.mod)]) >= 1)]
+    for d in ruled_out:
+        relation[d].fix(0)
+    # every row gets the smallest M that leaves it slack when its relation is off, from the bounds of its rooms
+    for p, n in pairs:
+        rows = {Direction.north: (model.y[p], model.y[n]), Direction.east: (model.x[n], model.x[p]),
+                Direction.south: (model.y[n], model.y[p]), Direction.west: (model.x[p], model.x[n]),
+                Direction.up: (model.z[p], model.z[n]), Direction.down: (model.z[n], model.z[p])}
+        for d, (lo, hi) in rows.items():
+            if relation[d].fixed: continue
+            M = big_m(model, lo, hi)
+            model.big_m.append(M)
+            constraints.append(model.crossings.add(lo - hi >= model.d_min - M*(1 - relation[d])))
+
+    # seed the relation closest to holding in the current solution for the next MIP start
+    rooms = (ex.p_room, ex.n_room, nx.p_room, nx.n_room)
+    if None not in [var[r].value for var in (model.x, model.y, model.z) for r in rooms]:
+        margins = {Direction.north: min([model.y[p].value - model.y[n].value for p, n in pairs]),
+                   Direction.east: min([model.x[n].value - model.x[p].value for p, n in pairs]),
+                   Direction.south: min([model.y[n].value - model.y[p].value for p, n in pairs]),
+                   Direction.west: min([model.x[p].value - model.x[n].value for p, n in pairs]),
+                   Direction.up: min([model.z[p].value - model.z[n].value for p, n in pairs]),
+                   Direction.down: min([model.z[n].value - model.z[p].value for p, n in pairs])}
+        best = max([d for d in margins if not relation[d].fixed], key=margins.get)
+        for d in margins:
+            if not relation[d].fixed: relation[d].value = 1 if d == best else 0
+
+    return relation, constraints
+
+def solve(rdb, exits, max_cuts=None, cut_order='deepest', warmstart=True, persistent=None, fixed={},
+          solver=None, threads=None, time_limit=None, gap=.05):
     # add fake looped exits for no-exit rooms to prevent overlapping placement
     for room in rdb.values():
         if not len(room.exits):
@@ -198,13 +558,50 @@ def solve(rdb, exits):
     model.Rooms = Set(initialize=rdb.keys())
     model.Exits = RangeSet(0, len(exits)-1)
     model.Directions = RangeSet(0, Direction.mod.value-1)
-    model.M = Param(initialize=sum([e.distance for e in exits]))
+    model.M = Param(initialize=sum([e.distance for e in exits]) + max([0]+[max(p) for p in fixed.values()]))
     model.d_min = Param(initialize=1)
 
-    # room position
-    model.x = Var(model.Rooms, within=Integers, bounds=(0,model.M))
-    model.y = Var(model.Rooms, within=Integers, bounds=(0,model.M))
-    model.z = Var(model.Rooms, within=Integers, bounds=(0,model.M))
+    # room position, one variable per axis for every class of rooms two-way exits keep level on that axis
+    # model.x/y/z map rooms to the variable of their class
+    level = [ex for ex in exits if not ex.one_way and ex.n_room != ex.p_room]
+    for axis, name in enumerate('xyz'):
+        moving = [(Direction.east, Direction.west), (Direction.north, Direction.south), (Direction.up, Direction.down)][axis]
+        members = equal_classes(rdb, [(ex.p_room, ex.n_room) for ex in level if ex.direction not in moving])
+        var = Var(RangeSet(0, max(members.values())), within=Integers, bounds=(0,model.M))
+        model.add_component('class_'+name, var)
+        setattr(model, name, {vnum: var[c] for vnum, c in members.items()})
+    print('[!] %d rooms share %d x, %d y and %d z coordinates.'%(len(rdb), len(model.class_x), len(model.class_y),
+                                                                 len(model.class_z)))
+
+    # narrow every class to the range the exits running along its axis leave it in the box
+    M = value(model.M)
+    spans = []
+    for axis, name in enumerate('xyz'):
+        var, rooms = getattr(model, 'class_'+name), getattr(model, name)
+        index = {id(v): c for c, v in var.items()}
+        up, down = [(Direction.east, Direction.west), (Direction.north, Direction.south), (Direction.up, Direction.down)][axis]
+        order = [(index[id(rooms[ex.p_room])], index[id(rooms[ex.n_room])], ex.distance) for ex in level if ex.direction == up] + \
+                [(index[id(rooms[ex.n_room])], index[id(rooms[ex.p_room])], ex.distance) for ex in level if ex.direction == down]
+        pinned = {}
+        for vnum, p in fixed.items():
+            pinned.setdefault(index[id(rooms[vnum])], set()).add(p[axis])
+        lb, ub = tighten(len(var), order, M, {c: v.pop() for c, v in pinned.items() if len(v) == 1})
+        for c in var:
+            # crossed bounds mean the model is infeasible anyway, leave that for the solver to report
+            if lb[c] <= ub[c]: var[c].setlb(lb[c]); var[c].setub(ub[c])
+            spans.append(var[c].ub - var[c].lb)
+    model.big_m = []
+    # a class can only take one fixed position, contradicting ones are left to make the model infeasible
+    model.pinned = ConstraintList()
+    pins = {}
+    for vnum, p in fixed.items():
+        for var, coordinate in zip((model.x, model.y, model.z), p):
+            pins.setdefault(id(var[vnum]), (var[vnum], set()))[1].add(coordinate)
+    for var, values in pins.values():
+        if len(values) == 1:
+            var.fix(values.pop())
+        else:
+            for coordinate in values: model.pinned.add(var == coordinate)
     # exits
     model.l_max = Var(model.Exits, within=PositiveIntegers)
     model.l_min = Param(model.Exits, initialize=lambda model, x: exits[x].distance)
@@ -218,10 +615,7 @@ def solve(rdb, exits):
     # add constraints
     for i, ex in enumerate(exits):
         # one-ways tend to violate embedding constraints, so add them to objective and then ignore
-        # mazes also break embedding constraints, so let's treat obvious ones as one-ways
-        if not ex in rdb[ex.n_room].exits or \
-           len([e for e in rdb[ex.p_room].exits if ex.n_room in e]) > 1:
-            ex.one_way = True
+        if ex.one_way:
             x_off = model.d_min if ex.direction == Direction.east else -model.d_min if ex.direction == Direction.west else 0
             y_off = model.d_min if ex.direction == Direction.north else -model.d_min if ex.direction == Direction.south else 0
             z_off = model.d_min if ex.direction == Direction.up else -model.d_min if ex.direction == Direction.down else 0
@@ -242,14 +636,8 @@ def solve(rdb, exits):
 
         # relative position O(e)
         # loops create contradictions for relative position
+        # the axes the exit doesn't move along are already shared through the room classes
         if ex.n_room != ex.p_room:
-            if ex.direction not in (Direction.east, Direction.west):
-                model.relative_pos.add(model.x[ex.p_room] == model.x[ex.n_room])
-            if ex.direction not in (Direction.north, Direction.south):
-                model.relative_pos.add(model.y[ex.p_room] == model.y[ex.n_room])
-            if ex.direction not in (Direction.up, Direction.down):
-                model.relative_pos.add(model.z[ex.p_room] == model.z[ex.n_room])
-
             if ex.direction == Direction.north:
                 model.relative_pos.add(model.y[ex.p_room] + model.l_min[i] <= model.y[ex.n_room])
                 model.relative_pos.add(model.y[ex.p_room] + model.l_max[i] >= model.y[ex.n_room])
@@ -275,137 +663,342 @@ def solve(rdb, exits):
     print('[+] Entering solving loop...')
 
     # constraints for exit crossings
-    # loops don't help for crossings unless they're the only exit in a room
-    considered = [ex for ex in exits if ex.n_room != ex.p_room or len(rdb[ex.n_room].exits) > 1]
-    non_incidents = list(filter(lambda ex: ex[0].p_room not in ex[1] and ex[0].n_room not in ex[1],
-                                itertools.combinations(considered, 2)))
-    print('[!] %d possible overlaps.'%(len(non_incidents)))
+    # loops don't help for crossings unless they're the only exit in a room, one-ways are ignored
+    considered = [ex for ex in exits if not ex.one_way and (ex.n_room != ex.p_room or len(rdb[ex.n_room].exits) > 1)]
+    rooms = list(rdb.keys())
+    index = {vnum: i for i, vnum in enumerate(rooms)}
+    detector = Overlap.Detector([(index[ex.p_room], index[ex.n_room]) for ex in considered])
+    print('[!] %d exits checked for overlaps.'%(len(considered)))
     model.crossings = ConstraintList()
-    relations=0
+    relations = 0
+    unavoidable = 0
+    rounds = 0
+    done = set()
 
-    solver = SolverFactory('cbc')
-    solver.options['ratio'] = .05
+    name = solver or 'cbc'
+    if persistent:
+        solver = Solvers.factory(persistent, gap, threads)
+        solver.set_instance(model)
+    else:
+        solver = Solvers.factory(name, gap, threads)
+    # time_limit covers all rounds, whatever is left of it is handed to the next one
+    deadline = None if time_limit is None else time.time() + time_limit
+    # plugins without MIP starts (glpk) reject a warmstart argument even when it is False
+    capable = warmstart and solver.warm_start_capable()
 
+    # cutting-plane loop: solve, separate every violated pair, add the best max_cuts of them
+    # every round after the first starts from the previous solution and seeded relations
+    elapsed = 0
     while True:
-        result = solver.solve(model, tee=False)
-        for pair in non_incidents:
-            ex, nx = pair
-            if None in [model.x[ex.p_room].value, model.x[ex.n_room].value, model.x[nx.p_room].value, model.x[nx.n_room].value,
-                        model.y[ex.p_room].value, model.y[ex.n_room].value, model.y[nx.p_room].value, model.y[nx.n_room].value,
-                        model.z[ex.p_room].value, model.z[ex.n_room].value, model.z[nx.p_room].value, model.z[nx.n_room].value]: continue
-            if max(model.x[ex.p_room].value, model.x[ex.n_room].value) < min(model.x[nx.p_room].value, model.x[nx.n_room].value) or \
-               min(model.x[ex.p_room].value, model.x[ex.n_room].value) < max(model.x[nx.p_room].value, model.x[nx.n_room].value) or \
-               max(model.y[ex.p_room].value, model.y[ex.n_room].value) < min(model.y[nx.p_room].value, model.y[nx.n_room].value) or \
-               min(model.y[ex.p_room].value, model.y[ex.n_room].value) < max(model.y[nx.p_room].value, model.y[nx.n_room].value) or \
-               max(model.z[ex.p_room].value, model.z[ex.n_room].value) < min(model.z[nx.p_room].value, model.z[nx.n_room].value) or \
-               min(model.z[ex.p_room].value, model.z[ex.n_room].value) < max(model.z[nx.p_room].value, model.z[nx.n_room].value): continue
-
-            relation = Var(model.Directions, within=Boolean)
-            model.add_component('relation%d'%(relations), relation)
-            relations += 1
-            model.crossings.add(sum([relation[i] for i in range(Direction.mod)]) >= 1)
-
-            # north
-            model.crossings.add(model.y[ex.p_room] - model.y[nx.p_room] >= \
-                                model.d_min - model.M*(1 - relation[Direction.north]))
-            model.crossings.add(model.y[ex.p_room] - model.y[nx.n_room] >= \
-                                model.d_min - model.M*(1 - relation[Direction.north]))
-            model.crossings.add(model.y[ex.n_room] - model.y[nx.p_room] >= \
-                                model.d_min - model.M*(1 - relation[Direction.north]))
-            model.crossings.add(model.y[ex.n_room] - model.y[nx.n_room] >= \
-                                model.d_min - model.M*(1 - relation[Direction.north]))
-            # east
-            model.crossings.add(model.x[ex.p_room] - model.x[nx.p_room] <= \
-                                model.M*(1 - relation[Direction.east]) - model.d_min)
-            model.crossings.add(model.x[ex.p_room] - model.x[nx.n_room] <= \
-                                model.M*(1 - relation[Direction.east]) - model.d_min)
-            model.crossings.add(model.x[ex.n_room] - model.x[nx.p_room] <= \
-                                model.M*(1 - relation[Direction.east]) - model.d_min)
-            model.crossings.add(model.x[ex.n_room] - model.x[nx.n_room] <= \
-                                model.M*(1 - relation[Direction.east]) - model.d_min)
-            # south
-            model.crossings.add(model.y[ex.p_room] - model.y[nx.p_room] <= \
-                                model.M*(1 - relation[Direction.south]) - model.d_min)
-            model.crossings.add(model.y[ex.p_room] - model.y[nx.n_room] <= \
-                                model.M*(1 - relation[Direction.south]) - model.d_min)
-            model.crossings.add(model.y[ex.n_room] - model.y[nx.p_room] <= \
-                                model.M*(1 - relation[Direction.south]) - model.d_min)
-            model.crossings.add(model.y[ex.n_room] - model.y[nx.n_room] <= \
-                                model.M*(1 - relation[Direction.south]) - model.d_min)
-            # west
-            model.crossings.add(model.x[ex.p_room] - model.x[nx.p_room] >= \
-                                model.d_min - model.M*(1 - relation[Direction.west]))
-            model.crossings.add(model.x[ex.p_room] - model.x[nx.n_room] >= \
-                                model.d_min - model.M*(1 - relation[Direction.west]))
-            model.crossings.add(model.x[ex.n_room] - model.x[nx.p_room] >= \
-                                model.d_min - model.M*(1 - relation[Direction.west]))
-            model.crossings.add(model.x[ex.n_room] - model.x[nx.n_room] >= \
-                                model.d_min - model.M*(1 - relation[Direction.west]))
-            # up
-            model.crossings.add(model.z[ex.p_room] - model.z[nx.p_room] >= \
-                                model.d_min - model.M*(1 - relation[Direction.up]))
-            model.crossings.add(model.z[ex.p_room] - model.z[nx.n_room] >= \
-                                model.d_min - model.M*(1 - relation[Direction.up]))
-            model.crossings.add(model.z[ex.n_room] - model.z[nx.p_room] >= \
-                                model.d_min - model.M*(1 - relation[Direction.up]))
-            model.crossings.add(model.z[ex.n_room] - model.z[nx.n_room] >= \
-                                model.d_min - model.M*(1 - relation[Direction.up]))
-            # down
-            model.crossings.add(model.z[ex.p_room] - model.z[nx.p_room] <= \
-                                model.M*(1 - relation[Direction.down]) - model.d_min)
-            model.crossings.add(model.z[ex.p_room] - model.z[nx.n_room] <= \
-                                model.M*(1 - relation[Direction.down]) - model.d_min)
-            model.crossings.add(model.z[ex.n_room] - model.z[nx.p_room] <= \
-                                model.M*(1 - relation[Direction.down]) - model.d_min)
-            model.crossings.add(model.z[ex.n_room] - model.z[nx.n_room] <= \
-                                model.M*(1 - relation[Direction.down]) - model.d_min)
-
-            non_incidents.remove(pair)
-            break
+        start = time.time()
+        warm = {'warmstart': rounds > 0} if capable else {}
+        if deadline is not None: Solvers.limit(solver, persistent or name, deadline - start)
+        if persistent:
+            result = solver.solve(tee=False, **warm)
         else:
+            result = solver.solve(model, tee=False, load_solutions=False, **warm)
+        rounds += 1
+        took = time.time() - start
+        elapsed += took
+        termination = result.solver.termination_condition
+        timeout = termination == pyomo.opt.TerminationCondition.maxTimeLimit
+        stale = False
+        if len(result.solution) and termination in (pyomo.opt.TerminationCondition.optimal,
+                                                    pyomo.opt.TerminationCondition.maxTimeLimit):
+            # persistent solvers load their incumbent into the model themselves
+            if not persistent: model.solutions.load_from(result)
+        elif timeout and rounds > 1:
+            stale = True
+        else:
+            # out of time before the first incumbent, or failed: settle() reports it
+            if timeout: result.solver.termination_condition = pyomo.opt.TerminationCondition.noSolution
+            break
+        # coordinates no row mentions aren't handed to the solver, they are free to sit at their lower bound
+        for var in (model.class_x, model.class_y, model.class_z):
+            for v in var.values():
+                if v.value is None: v.set_value(v.lb)
+        xs, ys, zs = ([None if var[vnum].value is None else round(var[vnum].value) for vnum in rooms]
+                      for var in (model.x, model.y, model.z))
+        violated = detector.collisions(xs, ys, zs, set() if stale else done)
+        if not len(violated): break
+        if timeout or deadline is not None and time.time() >= deadline:
+            # the last incumbent, or the previous round's layout when this one found none, is kept
+            print('[-] Time limit reached after %d rounds, keeping a layout with %d overlaps.'%(rounds, len(violated)))
+            result.solver.termination_condition = pyomo.opt.TerminationCondition.maxTimeLimit
+            break
+
+        if cut_order == 'deepest':
+            violated.sort(key=lambda v: -v[0])
+        # pairs whose rooms share a coordinate on every axis can't be pulled apart, they are skipped for good
+        cuts = 0
+        for depth, i, j in violated:
+            if max_cuts is not None and cuts >= max_cuts: break
+            done.add((i, j))
+            relation, constraints = add_crossing(model, (considered[i], considered[j]), relations)
+            if relation is None:
+                unavoidable += 1
+                continue
+            relations += 1
+            cuts += 1
+            if persistent:
+                solver.add_var(relation)
+                for c in constraints: solver.add_constraint(c)
+        print('[*] Round %d: %.2fs, %d overlaps, %d cuts added.'%(rounds, took, len(violated), cuts))
+        if not cuts: break
+
+    # integer columns come back within the solver's tolerance, snap them to the cells the overlaps were checked on
+    for var in (model.class_x, model.class_y, model.class_z):
+        for v in var.values():
+            if v.value is not None: v.set_value(round(v.value))
+    if unavoidable:
+        print('[-] %d overlaps kept, the rooms of their exits share a coordinate on every axis.'%(unavoidable))
+    print('[!] %d overlaps converted into constraints in %d rounds (%.2fs solving).'%(relations, rounds, elapsed))
+    print('[!] Coordinate ranges %.1f on average, crossing big-M %.1f on average, %d before tightening.'%(
+        sum(spans)/max(1, len(spans)), sum(model.big_m)/max(1, len(model.big_m)), M))
+    return model, result
+
+def solve_sparse(rdb, exits, max_cuts=None, cut_order='deepest', warmstart=True, persistent=None, fixed={},
+                 solver=None, threads=None, time_limit=None, gap=.05):
+    # the formulation of solve() assembled straight into a Matrix.Model instead of pyomo expressions
+    # model.x/y/z map rooms to column views so settle() reads both the same way
+    for room in rdb.values():
+        if not len(room.exits):
+            exit = Exit((0, room.vnum), room.vnum)
+            room.exits.append(exit)
+            exits.append(exit)
+
+    model = Matrix.Model()
+    M = sum([e.distance for e in exits]) + max([0]+[max(p) for p in fixed.values()])
+    d_min = 1
+
+    # room position, one column per coordinate class with the bounds tighten() leaves it
+    level = [ex for ex in exits if not ex.one_way and ex.n_room != ex.p_room]
+    coordinates = {vnum: [None]*3 for vnum in rdb}
+    spans = []
+    for axis in range(3):
+        up, down = [(Direction.east, Direction.west), (Direction.north, Direction.south), (Direction.up, Direction.down)][axis]
+        members = equal_classes(rdb, [(ex.p_room, ex.n_room) for ex in level if ex.direction not in (up, down)])
+        classes = max(members.values()) + 1
+        order = [(members[ex.p_room], members[ex.n_room], ex.distance) for ex in level if ex.direction == up] + \
+                [(members[ex.n_room], members[ex.p_room], ex.distance) for ex in level if ex.direction == down]
+        pinned = {}
+        for vnum, p in fixed.items():
+            pinned.setdefault(members[vnum], set()).add(p[axis])
+        lb, ub = tighten(classes, order, M, {c: min(v) for c, v in pinned.items() if len(v) == 1})
+        # crossed bounds leave the class its box, the solver reports the infeasibility as in solve()
+        columns = [model.var(lb[c], ub[c]) if lb[c] <= ub[c] else model.var(0, M) for c in range(classes)]
+        for c, values in pinned.items():
+            if len(values) == 1:
+                model.fix(columns[c], min(values))
+            else:
+                for v in values: model.row([(columns[c], 1)], v, v)
+        for vnum, c in members.items():
+            coordinates[vnum][axis] = columns[c]
+        spans += [model.ub[c] - model.lb[c] for c in columns]
+    print('[!] %d rooms share %d x, %d y and %d z coordinates.'%(len(rdb), *[len(set([c[axis] for c in coordinates.values()]))
+                                                                              for axis in range(3)]))
+    model.x, model.y, model.z = ({vnum: Matrix.Column(model, c[axis]) for vnum, c in coordinates.items()} for axis in range(3))
+
+    for ex in exits:
+        l_max = model.var(1, cost=1)
+        p, n = coordinates[ex.p_room], coordinates[ex.n_room]
+        # one-ways only pull their rooms towards a step in their direction through the objective
+        if ex.one_way:
+            offset = step(ex.direction, d_min)
+            for axis in range(3):
+                slack = model.var(0, M, cost=1)
+                model.row([(n[axis], 1), (p[axis], -1), (slack, -1)], hi=offset[axis])
+                model.row([(n[axis], -1), (p[axis], 1), (slack, -1)], hi=-offset[axis])
+            model.ub[l_max] = 1
+            continue
+        if ex.n_room == ex.p_room: continue
+        axis, sign = {Direction.east: (0, 1), Direction.west: (0, -1), Direction.north: (1, 1),
+                      Direction.south: (1, -1), Direction.up: (2, 1), Direction.down: (2, -1)}[ex.direction]
+        model.row([(n[axis], sign), (p[axis], -sign)], lo=ex.distance)
+        model.row([(n[axis], sign), (p[axis], -sign), (l_max, -1)], hi=0)
+
+    print('[+] Entering solving loop...')
+
+    considered = [ex for ex in exits if not ex.one_way and (ex.n_room != ex.p_room or len(rdb[ex.n_room].exits) > 1)]
+    rooms = list(rdb.keys())
+    index = {vnum: i for i, vnum in enumerate(rooms)}
+    detector = Overlap.Detector([(index[ex.p_room], index[ex.n_room]) for ex in considered])
+    print('[!] %d exits checked for overlaps.'%(len(considered)))
+    backend = Matrix.solver(solver, gap, threads)
+    deadline = None if time_limit is None else time.time() + time_limit
+    big_ms = []
+    relations = 0
+    unavoidable = 0
+    rounds = 0
+    done = set()
+
+    elapsed = 0
+    while True:
+        start = time.time()
+        status = backend.solve(model, warmstart=warmstart and rounds > 0,
+                               time_limit=None if deadline is None else max(.01, deadline - start))
+        rounds += 1
+        took = time.time() - start
+        elapsed += took
+        timeout = deadline is not None and time.time() >= deadline
+        # out of time without a new incumbent, the previous round's layout is still in model.solution
+        stale = status == 'other' and timeout and rounds > 1
+        if status not in ('optimal', 'limit') and not stale: break
+        xs, ys, zs = ([round(model[coordinates[vnum][axis]]) for vnum in rooms] for axis in range(3))
+        violated = detector.collisions(xs, ys, zs, set() if stale else done)
+        if not len(violated): break
+        if status != 'optimal' or timeout:
+            print('[-] Time limit reached after %d rounds, keeping a layout with %d overlaps.'%(rounds, len(violated)))
+            status = 'limit'
             break
-            
-    print('[!] %d/%d overlaps converted into constraints.'%(relations, len(non_incidents)))
+
+        if cut_order == 'deepest':
+            violated.sort(key=lambda v: -v[0])
+        # pairs whose rooms share a coordinate on every axis can't be pulled apart, they are skipped for good
+        cuts = 0
+        for depth, i, j in violated:
+            if max_cuts is not None and cuts >= max_cuts: break
+            done.add((i, j))
+            ms = add_sparse_crossing(model, coordinates, (considered[i], considered[j]), d_min, M)
+            if ms is None:
+                unavoidable += 1
+                continue
+            big_ms += ms
+            relations += 1
+            cuts += 1
+        print('[*] Round %d: %.2fs, %d overlaps, %d cuts added.'%(rounds, took, len(violated), cuts))
+        if not cuts: break
+
+    # integer columns come back within the solver's tolerance, snap them to the cells the overlaps were checked on
+    if model.solution is not None:
+        for c in set([c for columns in coordinates.values() for c in columns]):
+            model.solution[c] = round(model.solution[c])
+    if unavoidable:
+        print('[-] %d overlaps kept, the rooms of their exits share a coordinate on every axis.'%(unavoidable))
+    print('[!] %d overlaps converted into constraints in %d rounds (%.2fs solving).'%(relations, rounds, elapsed))
+    print('[!] Coordinate ranges %.1f on average, crossing big-M %.1f on average, %d before tightening.'%(
+        sum(spans)/max(1, len(spans)), sum(big_ms)/max(1, len(big_ms)), M))
+    result = pyomo.opt.SolverResults()
+    result.solver.termination_condition = {'optimal': pyomo.opt.TerminationCondition.optimal,
+                                           'limit': pyomo.opt.TerminationCondition.maxTimeLimit,
+                                           'infeasible': pyomo.opt.TerminationCondition.infeasible
+                                           }.get(status, pyomo.opt.TerminationCondition.unknown)
     return model, result
 
-def graph(rdb, name, area):
-    # clean up hallways (improves performance)
-    for vnum, r in list(rdb.items()):
-        if len(r.exits) == 2:
-            # if real, bidirectional and straight
-            if not all(e.n_room in rdb.keys() for e in r.exits): continue
-            if not all([e in rdb[e.n_room].exits for e in r.exits]): continue
-            if r.exits[0].direction == r.exits[1].direction.invert():
-                rdb[r.exits[0].n_room].replace_exit(vnum, r.exits[1].n_room, r.exits[1].distance)
-                rdb[r.exits[1].n_room].replace_exit(vnum, r.exits[0].n_room, r.exits[0].distance)
-                rdb[r.exits[0].n_room].fixups.append((r, r.exits[0].direction.invert(), r.exits[0].distance))
-                del rdb[vnum]
-                print('%s [*] Trimmed hallway %d.'%(area[1], vnum))
+def add_sparse_crossing(model, coordinates, pair, d_min, M):
+    # add_crossing() for a Matrix.Model, returns the big-M of every row added or None when no direction can hold
+    ex, nx = pair
+    pairs = list(itertools.product((ex.p_room, ex.n_room), (nx.p_room, nx.n_room)))
+    axes = {Direction.north: 1, Direction.east: 0, Direction.south: 1, Direction.west: 0, Direction.up: 2, Direction.down: 2}
+    ruled_out = [d for d, axis in axes.items() if any([coordinates[p][axis] == coordinates[n][axis] for p, n in pairs])]
+    if len(ruled_out) == Direction.mod: return None
+
+    relation = [model.var(0, 1) for d in range(Direction.mod)]
+    for d in ruled_out:
+        model.fix(relation[d], 0)
+    model.row([(relation[d], 1) for d in axes if not model.fixed(relation[d])], lo=1)
+
+    ms = []
+    for p, n in pairs:
+        rows = {Direction.north: (p, n), Direction.east: (n, p), Direction.south: (n, p),
+                Direction.west: (p, n), Direction.up: (p, n), Direction.down: (n, p)}
+        for d, (lo, hi) in rows.items():
+            if model.fixed(relation[d]): continue
+            lo, hi = coordinates[lo][axes[d]], coordinates[hi][axes[d]]
+            big = min(max(0, d_min + model.ub[hi] - model.lb[lo]), M)
+            ms.append(big)
+            model.row([(lo, 1), (hi, -1), (relation[d], -big)], lo=d_min - big)
+
+    # seed the relation closest to holding in the current solution for the next MIP start
+    if model.solution is not None:
+        at = lambda vnum, axis: model[coordinates[vnum][axis]]
+        margins = {d: min([at(lo, axes[d]) - at(hi, axes[d]) for lo, hi in
+                           [{Direction.north: (p, n), Direction.east: (n, p), Direction.south: (n, p),
+                             Direction.west: (p, n), Direction.up: (p, n), Direction.down: (n, p)}[d] for p, n in pairs]])
+                   for d in axes if not model.fixed(relation[d])}
+        best = max(margins, key=margins.get)
+        model.solution += [0.0]*(model.columns - len(model.solution))
+        for d in margins:
+            model.solution[relation[d]] = 1 if d == best else 0
+    return ms
+
+def arrange(rdb, area, options={}, engine='milp', decompose=False, cache=None, incremental=False, outside={},
+            keep=frozenset(), deadline=None):
+    # lay out one component, rooms get their positions based at (0,0,0) and dummy rooms stand in for exits
+    # leading out of it; returns the exits to draw and the rooms simplify() took out and restored
+    # keep and deadline are set for the second pass when dead ends couldn't be restored clear of the layout
+    # the time limit covers the whole component, every solve in it gets what the ones before it left
+    budget = dict(options)
+    if budget.get('time_limit') is not None:
+        limit = budget.pop('time_limit')
+        budget['deadline'] = deadline if deadline is not None else time.time() + limit
+
+    # the component as it came, to lay it out again with its dead ends in the model
+    records = [(r.vnum, r.name, r.desc, [(direction_matrix.index(e.direction), e.n_room) for e in r.exits])
+               for r in rdb.values()]
+
+    # take chains, dead ends and maze twins out of the model (improves performance)
+    pruned = simplify(rdb, area, keep)
 
     # collect normal exits for solve/plotting
     exits = list(set([e for r in rdb.values() for e in r.exits]))
 
-    # insert dummy rooms for zone exits
+    # insert dummy rooms for zone exits, named after where they lead when the world is known
     for e in exits:
         if e.n_room not in rdb:
-            rdb[e.n_room] = Room((e.p_room, '', '', None))
+            title, owner = outside.get(e.n_room, ('', ''))
+            if owner:
+                print('%s [*] Exit %d -> %d leads to %s.'%(area[1], e.p_room, e.n_room, owner))
+            rdb[e.n_room] = Room((e.n_room, title, owner, None))
             rdb[e.n_room].dummy = True
 
-    # solve
-    print('%s [+] Solving for %d exits...'%(area[1], len(exits)))
-    model, results = solve(rdb, exits)
-    if not results.solver.termination_condition == pyomo.opt.TerminationCondition.optimal:
-        print('%s [-] Solver failed!%s' %(area[1], str(results.solver)))
-    else:
-        print('%s [+] Solve completed. Plotting...'%(area[1]))
+    # reuse a previous layout of the same trimmed component under the same settings
+    positions = None
+    if cache is not None:
+        key = Cache.key(sorted([(vnum, r.dummy) for vnum, r in rdb.items()]),
+                        sorted([e.key() for e in exits]),
+                        options, engine, decompose)
+        signatures = exit_signatures(rdb, exits)
+        vnums = [vnum for vnum, r in rdb.items() if not r.dummy]
+        positions = cache.get(key)
+        if positions is not None:
+            print('%s [+] Layout loaded from cache. Plotting...'%(area[1]))
+        elif incremental:
+            # pin rooms that kept their exits since the last layout of this component
+            previous = cache.recall(vnums)
+            solved = relayout(rdb, exits, previous, signatures, area, budget) if previous is not None else None
+            if solved is not None:
+                positions, status = solved
+                if status == pyomo.opt.TerminationCondition.optimal: cache.put(key, positions)
+                print('%s [+] Layout completed. Plotting...'%(area[1]))
 
-    # retrieve room positions and restore collapsed rooms
-    for vnum, room in list(rdb.items()):
-        room.x = model.x[vnum].value if model.x[vnum].value else 0
-        room.y = model.y[vnum].value if model.y[vnum].value else 0
-        room.z = model.z[vnum].value if model.z[vnum].value else 0
-        for r in restore_rooms(room):
-            rdb[r.vnum] = r
+    # lay out, layouts cut short by the time limit or a failed solve are not cached
+    if positions is None:
+        if decompose:
+            positions, status = stitch(rdb, exits, area, budget, engine)
+            positions, status = resolve(rdb, exits, positions, area, budget, status)
+        else:
+            positions, status = layout(rdb, exits, area, budget, engine)
+        if cache is not None and status == pyomo.opt.TerminationCondition.optimal: cache.put(key, positions)
+        print('%s [+] Layout completed. Plotting...'%(area[1]))
+    if cache is not None:
+        cache.remember(vnums, shifted(positions), signatures)
+
+    # retrieve room positions and restore removed rooms and exits
+    for vnum, room in rdb.items():
+        room.x, room.y, room.z = positions[vnum]
+    restored, tangled = restore_rooms(rdb)
+    if len(tangled) and not len(keep) and (budget.get('deadline') is None or time.time() < budget['deadline']):
+        print('%s [-] %d dead ends cross the layout, solving again without pruning dead ends...'%(area[1], len(tangled)))
+        rdb.clear()
+        rdb.update(materialize(RoomGraph.RoomGraph.from_records(records)))
+        return arrange(rdb, area, options, engine, decompose, cache, incremental, outside, frozenset(restored),
+                       budget.get('deadline'))
+    if len(tangled):
+        print('%s [-] %d dead ends left crossing the layout.'%(area[1], len(tangled)))
+    for vnum, ex in pruned:
+        if ex not in rdb[vnum].exits: rdb[vnum].exits.append(ex)
+    exits = list(set(exits + [ex for vnum, ex in pruned]))
 
     # shift room base to (0,0,0) 
     x_min = min([r.x for r in rdb.values()])
@@ -415,51 +1008,147 @@ def graph(rdb, name, area):
         r.x -= x_min
         r.y -= y_min
         r.z -= z_min
+    return exits, restored
+
+def graph(rdb, name, area, options={}, engine='milp', decompose=False, cache=None, incremental=False, outside={},
+          plotter=Plotter, export=False):
+    exits, restored = arrange(rdb, area, options, engine, decompose, cache, incremental, outside)
+
+    # keep the layout so it can be plotted again without solving
+    if export:
+        Render.write_layout(os.path.splitext(name)[0] + Render.LAYOUT_EXT, area, rdb, exits, restored)
 
     # plot
-    dwg = Plotter(name, rdb, exits)
+    dwg = plotter(name, rdb, exits)
     dwg.plot()
 
     return
 
+def render(job):
+    # pool worker: graph one component and hand back its log in one piece
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        graph(*job)
+    return log.getvalue()
+
+def arguments(cli):
+    # options of parsing, laying out and plotting, shared with Atlas.py
+    cli.add_argument('--parser', choices=('ply', 'fast'), default='ply',
+                     help='fast reads the area with the streaming line reader instead of the grammar')
+    cli.add_argument('--area-cache', metavar='DIR', default=None,
+                     help='keep parsed areas in DIR and only parse files changed since')
+    cli.add_argument('--engine', choices=('milp', 'greedy'), default='milp',
+                     help='greedy places rooms by walking the exits and only solves for conflicts')
+    cli.add_argument('--decompose', action='store_true',
+                     help='lay out blocks between bridges and articulation rooms separately')
+    cli.add_argument('--max-cuts', type=int, default=None,
+                     help='crossing constraints added per solve round (default: all violated)')
+    cli.add_argument('--cut-order', choices=('deepest', 'first'), default='deepest',
+                     help='which violated crossings to add first when limited by --max-cuts')
+    cli.add_argument('--no-warmstart', dest='warmstart', action='store_false',
+                     help='solve every round from scratch instead of the previous solution')
+    cli.add_argument('--model', choices=('pyomo', 'sparse'), default='pyomo',
+                     help='sparse builds the model as coefficient arrays and hands it to highs in memory or cbc as MPS')
+    cli.add_argument('--solver', choices=('auto',) + Solvers.NAMES, default=None,
+                     help='MILP backend, auto benchmarks the installed ones once and picks per component size '
+                          '(default: cbc, or highs if installed with --model sparse)')
+    cli.add_argument('--threads', type=int, default=None,
+                     help='threads the solver may use (not supported by glpk)')
+    cli.add_argument('--time-limit', metavar='SEC', type=float, default=None,
+                     help='wall-clock budget per component, the best layout found by then is kept')
+    cli.add_argument('--gap', type=float, default=.05,
+                     help='relative optimality gap a solve may stop at')
+    cli.add_argument('--persistent', metavar='SOLVER', choices=Solvers.PERSISTENT, default=None,
+                     help='keep the model loaded in a persistent pyomo solver (%s)'%(', '.join(Solvers.PERSISTENT)))
+    cli.add_argument('--cache', metavar='DIR', default=None,
+                     help='reuse layouts of unchanged components solved to optimality from this directory')
+    cli.add_argument('--cache-size', metavar='MB', type=int, default=64,
+                     help='size the layout cache is trimmed to, least recently used first')
+    cli.add_argument('--incremental', action='store_true',
+                     help='keep rooms whose exits are unchanged where the cached last layout put them')
+    Render.arguments(cli)
+    cli.add_argument('--export', action='store_true',
+                     help='also write every solved layout next to its svg, to be plotted again by Render.py')
+    cli.add_argument('--jobs', '-j', type=int, default=1,
+                     help='connected components solved in parallel')
+
+def settings(cli, args):
+    # layout options, layout cache and plotter the arguments ask for
+    if args.incremental and not args.cache:
+        cli.error('--incremental needs the last layouts kept by --cache')
+    options = {'max_cuts': args.max_cuts, 'cut_order': args.cut_order,
+               'warmstart': args.warmstart, 'persistent': args.persistent, 'model': args.model,
+               'solver': args.solver, 'threads': args.threads, 'time_limit': args.time_limit, 'gap': args.gap}
+
+    plotter = Render.plotter(args)
+
+    cache = Cache.LayoutCache(args.cache, args.cache_size*1024*1024) if args.cache else None
+
+    if args.solver == 'auto':
+        # timed once, and kept next to the layout cache when there is one
+        options['solvers'] = Solvers.load(os.path.join(args.cache, 'solvers.json') if args.cache else None,
+                                          gap=args.gap, threads=args.threads)
+    return options, cache, plotter
+
 def main():
-    parser = AreaParser.Parser()
-    with open(sys.argv[1], 'r') as f:
-        area = parser.parse(f.read())
-
-    for section in area:
-        if section[0] == '#ROOMS':
-            rooms = section[1]
-        elif section[0] == '#AREA':
-            area = section[1]
-
-    # construct rooms for graphing
-    rdb = {r[0]: Room(r) for r in rooms}
-
-    # break into connected graphs
-    count = 0
-    graphs = []
-    while len(rdb):
-        stack = [rdb.popitem()[1]]
-        sub_graph = {}
-        while len(stack):
-            r = stack.pop()
-            sub_graph[r.vnum] = r
-            for e in r.exits:
-                if e.n_room not in sub_graph.keys():
-                    if e.n_room in rdb.keys():
-                        stack.append(rdb.pop(e.n_room))
-                    else:
-                        for g in graphs:
-                            if e.n_room in g:
-                                graphs.remove(g)
-                                sub_graph.update(g)
-        graphs.append(sub_graph)
-
-    for g in graphs:
-        name, ext = os.path.splitext(sys.argv[2])
-        graph(g, name+str(count)+ext, area)
-        count += 1
+    cli = argparse.ArgumentParser(description='Lay out and plot the rooms of an area file.')
+    cli.add_argument('area', help='area file to map')
+    cli.add_argument('output', help='svg file, numbered per connected component')
+    cli.add_argument('--world', metavar='DIR', default=None,
+                     help='load every area in DIR and resolve exits leading out of the mapped area')
+    arguments(cli)
+    args = cli.parse_args()
+    options, cache, plotter = settings(cli, args)
+
+    compiled = AreaParser.Compiled(args.area_cache) if args.area_cache else None
+
+    outside = {}
+    if args.world:
+        # take the area from one parse of the whole world and resolve where its exits lead
+        world = World.World.load(args.world, args.jobs, args.parser, compiled)
+        path = world.find(args.area)
+        if path is None: cli.error('%s is not part of the world in %s'%(args.area, args.world))
+        area, rooms = world.areas[path], world.rooms[path]
+        for vnum, d, target, owner in world.crossings(path):
+            if owner is not None:
+                outside[target] = (world.room(target)[1], owner[1])
+    elif compiled is not None:
+        sections = dict(compiled.load(args.area, args.parser))
+        area, rooms = sections['#AREA'], sections.get('#ROOMS') or []
+    elif args.parser == 'fast':
+        # stream the records, nothing but rooms and the area header is kept
+        with open(args.area, 'r') as f:
+            for header, records in AreaParser.Reader().sections(f):
+                if header == '#ROOMS':
+                    rooms = list(records)
+                elif header == '#AREA':
+                    area = next(records)
+    else:
+        parser = AreaParser.Parser()
+        with open(args.area, 'r') as f:
+            area = parser.parse(f.read())
+
+        for section in area:
+            if section[0] == '#ROOMS':
+                rooms = section[1]
+            elif section[0] == '#AREA':
+                area = section[1]
+
+    # break into connected graphs, numbered largest first
+    # each component gets its Room and Exit objects only when its job is handed out
+    rooms = RoomGraph.RoomGraph.from_records(rooms)
+    name, ext = os.path.splitext(args.output)
+    jobs = ((materialize(rooms, members), name+str(count)+ext, area, options, args.engine, args.decompose, cache,
+             args.incremental, outside, plotter, args.export) for count, members in enumerate(rooms.components()))
+
+    if args.jobs > 1:
+        # components come largest first so the long solves overlap the short ones
+        with multiprocessing.Pool(args.jobs) as pool:
+            for log in pool.imap_unordered(render, jobs):
+                print(log, end='')
+    else:
+        for job in jobs:
+            graph(*job)
 
     exit(0)
 
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+import os
+import array
+import shutil
+import tempfile
+import subprocess
+
+INFINITY = float('inf')
+
+class Model():
+    # a MILP held as flat arrays, columns with bounds, integrality and cost, rows in CSR form with ranges
+    # columns are C<n> and rows R<n> in the order they were added, solvers only ever see appended ones
+    # and columns are not changed once a solver has seen them
+    def __init__(self):
+        self.lb = array.array('d')
+        self.ub = array.array('d')
+        self.integer = array.array('b')
+        self.cost = array.array('d')
+        self.starts = array.array('l', [0])
+        self.index = array.array('l')
+        self.value = array.array('d')
+        self.row_lo = array.array('d')
+        self.row_hi = array.array('d')
+        self.solution = None
+
+    @property
+    def columns(self):
+        return len(self.lb)
+
+    @property
+    def rows(self):
+        return len(self.row_lo)
+
+    def var(self, lb=0, ub=INFINITY, integer=True, cost=0):
+        self.lb.append(lb)
+        self.ub.append(ub)
+        self.integer.append(integer)
+        self.cost.append(cost)
+        return self.columns - 1
+
+    def row(self, terms, lo=-INFINITY, hi=INFINITY):
+        # terms are (column, coefficient) pairs, repeated columns are summed
+        merged = {}
+        for col, coef in terms:
+            merged[col] = merged.get(col, 0) + coef
+        for col, coef in merged.items():
+            if coef == 0: continue
+            self.index.append(col)
+            self.value.append(coef)
+        self.starts.append(len(self.index))
+        self.row_lo.append(lo)
+        self.row_hi.append(hi)
+        return self.rows - 1
+
+    def terms(self, r):
+        return zip(self.index[self.starts[r]:self.starts[r+1]], self.value[self.starts[r]:self.starts[r+1]])
+
+    def fix(self, col, value):
+        self.lb[col] = self.ub[col] = value
+
+    def fixed(self, col):
+        return self.lb[col] == self.ub[col]
+
+    def __getitem__(self, col):
+        # solved value of a column, None before the first solve or for columns added since
+        if self.solution is None or col >= len(self.solution): return None
+        return self.solution[col]
+
+    def write_mps(self, f):
+        # fixed column positions, names stay within eight characters up to ten million rows and columns
+        columns = [[] for c in range(self.columns)]
+        for r in range(self.rows):
+            for c, v in self.terms(r):
+                columns[c].append((r, v))
+        f.write('NAME          MAPPER\nROWS\n N  OBJ\n')
+        for r in range(self.rows):
+            lo, hi = self.row_lo[r], self.row_hi[r]
+            f.write(' %s  R%d\n'%('E' if lo == hi else 'G' if lo > -INFINITY else 'L', r))
+        f.write('COLUMNS\n')
+        marker = False
+        for c in range(self.columns):
+            if self.integer[c] != marker:
+                marker = self.integer[c]
+                f.write("    MARKER                 'MARKER'                 '%s'\n"%('INTORG' if marker else 'INTEND'))
+            entries = ([('OBJ', self.cost[c])] if self.cost[c] else []) + [('R%d'%(r), v) for r, v in columns[c]]
+            for name, v in entries or [('OBJ', 0)]:
+                f.write('    %-8s  %-8s  %12g\n'%('C%d'%(c), name, v))
+        if marker: f.write("    MARKER                 'MARKER'                 'INTEND'\n")
+        f.write('RHS\n')
+        for r in range(self.rows):
+            lo, hi = self.row_lo[r], self.row_hi[r]
+            rhs = lo if lo > -INFINITY else hi
+            if rhs: f.write('    RHS       %-8s  %12g\n'%('R%d'%(r), rhs))
+        f.write('RANGES\n')
+        for r in range(self.rows):
+            lo, hi = self.row_lo[r], self.row_hi[r]
+            if lo != hi and lo > -INFINITY and hi < INFINITY:
+                f.write('    RNG       %-8s  %12g\n'%('R%d'%(r), hi - lo))
+        f.write('BOUNDS\n')
+        for c in range(self.columns):
+            name = 'C%d'%(c)
+            if self.lb[c] == self.ub[c]:
+                f.write(' FX BND       %-8s  %12g\n'%(name, self.lb[c]))
+                continue
+            if self.lb[c] == -INFINITY: f.write(' MI BND       %s\n'%(name))
+            elif self.lb[c] != 0: f.write(' LO BND       %-8s  %12g\n'%(name, self.lb[c]))
+            if self.ub[c] < INFINITY: f.write(' UP BND       %-8s  %12g\n'%(name, self.ub[c]))
+            elif self.integer[c]: f.write(' PL BND       %s\n'%(name))
+        f.write('ENDATA\n')
+
+class Column():
+    # one column of a model, read like a solved pyomo variable
+    __slots__ = ('model', 'col')
+
+    def __init__(self, model, col):
+        self.model = model
+        self.col = col
+
+    @property
+    def value(self):
+        return self.model[self.col]
+
+class Highs():
+    # in memory through highspy, kept loaded between solves so later ones only pass what was appended
+    def __init__(self, gap=.05, threads=None):
+        import highspy
+        self.highspy = highspy
+        self.h = highspy.Highs()
+        self.h.setOptionValue('output_flag', False)
+        self.h.setOptionValue('mip_rel_gap', gap)
+        if threads: self.h.setOptionValue('threads', threads)
+        self.columns = 0
+        self.rows = 0
+
+    def solve(self, model, warmstart=False, time_limit=None):
+        # 'optimal', 'limit' when stopped early with an incumbent, 'infeasible' or 'other'
+        inf = self.h.getInfinity()
+        bound = lambda v: max(-inf, min(inf, v))
+        for c in range(self.columns, model.columns):
+            self.h.addCol(model.cost[c], bound(model.lb[c]), bound(model.ub[c]), 0, [], [])
+            if model.integer[c]: self.h.changeColIntegrality(c, self.highspy.HighsVarType.kInteger)
+        for r in range(self.rows, model.rows):
+            terms = list(model.terms(r))
+            self.h.addRow(bound(model.row_lo[r]), bound(model.row_hi[r]), len(terms),
+                          [c for c, v in terms], [v for c, v in terms])
+        self.columns, self.rows = model.columns, model.rows
+
+        if warmstart and model.solution is not None:
+            start = self.highspy.HighsSolution()
+            start.col_value = [model.solution[c] if c < len(model.solution) else max(0, model.lb[c])
+                               for c in range(model.columns)]
+            start.value_valid = True
+            self.h.setSolution(start)
+        self.h.setOptionValue('time_limit', float(time_limit) if time_limit else inf)
+        self.h.run()
+        status = self.h.getModelStatus()
+        if status == self.highspy.HighsModelStatus.kInfeasible: return 'infeasible'
+        if status != self.highspy.HighsModelStatus.kOptimal and not self.h.getInfo().primal_solution_status: return 'other'
+        model.solution = list(self.h.getSolution().col_value)
+        return 'optimal' if status == self.highspy.HighsModelStatus.kOptimal else 'limit'
+
+class Cbc():
+    # through an MPS file handed to the cbc executable every solve
+    def __init__(self, gap=.05, threads=None, executable='cbc'):
+        self.executable = shutil.which(executable) or executable
+        self.gap = gap
+        self.threads = threads
+
+    def solve(self, model, warmstart=False, time_limit=None):
+        with tempfile.TemporaryDirectory() as tmp:
+            mps, sol = os.path.join(tmp, 'model.mps'), os.path.join(tmp, 'model.sol')
+            with open(mps, 'w') as f:
+                model.write_mps(f)
+            command = [self.executable, mps, 'ratio', str(self.gap)]
+            if self.threads: command += ['threads', str(self.threads)]
+            if time_limit: command += ['sec', str(time_limit)]
+            if warmstart and model.solution is not None:
+                start = os.path.join(tmp, 'start.sol')
+                with open(start, 'w') as f:
+                    f.write('Stopped on iterations - objective value 0\n')
+                    for c, v in enumerate(model.solution):
+                        f.write('%d C%d %g 0\n'%(c, c, v))
+                command += ['mips', start]
+            subprocess.run(command + ['solve', 'solution', sol], stdout=subprocess.DEVNULL, check=True)
+            with open(sol, 'r') as f:
+                lines = f.read().splitlines()
+        if not len(lines) or lines[0].startswith('Infeasible'): return 'infeasible' if len(lines) else 'other'
+        solution = [0.0]*model.columns
+        found = False
+        for line in lines[1:]:
+            fields = line.replace('**', '').split()
+            if len(fields) >= 3 and fields[1].startswith('C'):
+                solution[int(fields[1][1:])] = float(fields[2])
+                found = True
+        if lines[0].startswith('Optimal'): status = 'optimal'
+        elif lines[0].startswith('Stopped') and found and 'no integer solution' not in lines[0]: status = 'limit'
+        else: return 'other'
+        model.solution = solution
+        return status
+
+class Glpk():
+    # through an MPS file handed to glpsol every solve, solutions come back in its raw format
+    def __init__(self, gap=.05, threads=None, executable='glpsol'):
+        self.executable = shutil.which(executable) or executable
+        self.gap = gap
+
+    def solve(self, model, warmstart=False, time_limit=None):
+        with tempfile.TemporaryDirectory() as tmp:
+            mps, sol = os.path.join(tmp, 'model.mps'), os.path.join(tmp, 'model.sol')
+            with open(mps, 'w') as f:
+                model.write_mps(f)
+            command = [self.executable, '--mps', mps, '--mipgap', str(self.gap), '-w', sol]
+            if time_limit: command += ['--tmlim', str(max(1, int(time_limit)))]
+            subprocess.run(command, stdout=subprocess.DEVNULL)
+            try:
+                with open(sol, 'r') as f:
+                    lines = [line.split() for line in f.read().splitlines()]
+            except FileNotFoundError:
+                return 'other'
+        # s mip <rows> <cols> <o|f|n|u> <objective>, then j <col> <value> per column
+        header = [l for l in lines if len(l) and l[0] == 's']
+        if not len(header) or len(header[0]) < 5: return 'other'
+        state = header[0][4]
+        if state == 'n': return 'infeasible'
+        if state not in ('o', 'f'): return 'other'
+        solution = [0.0]*model.columns
+        for l in lines:
+            if len(l) >= 3 and l[0] == 'j':
+                solution[int(l[1]) - 1] = float(l[2])
+        model.solution = solution
+        return 'optimal' if state == 'o' else 'limit'
+
+def solver(name=None, gap=.05, threads=None):
+    # highs runs in memory, cbc and glpk go through an MPS file; by default highs when highspy is installed
+    if name is None:
+        try:
+            import highspy
+            name = 'highs'
+        except ImportError:
+            name = 'cbc'
+    if name == 'highs': return Highs(gap, threads)
+    if name == 'glpk': return Glpk(gap, threads)
+    return Cbc(gap, threads)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import collections
+
+class Detector():
+    # spatial hash over exit bounding boxes
+    # segments are (p, n) pairs of indices into flat room coordinate lists
+    def __init__(self, segments, cell=1, spread=64):
+        self.segments = segments
+        self.cell = cell
+        # boxes covering more cells than this are checked against everything instead of hashed
+        self.spread = spread
+
+    def boxes(self, xs, ys, zs):
+        boxes = []
+        for p, n in self.segments:
+            if None in (xs[p], xs[n], ys[p], ys[n], zs[p], zs[n]):
+                boxes.append(None)
+                continue
+            boxes.append((min(xs[p], xs[n]), max(xs[p], xs[n]),
+                          min(ys[p], ys[n]), max(ys[p], ys[n]),
+                          min(zs[p], zs[n]), max(zs[p], zs[n])))
+        return boxes
+
+    def cells(self, box):
+        c = self.cell
+        x = range(int(box[0]//c), int(box[1]//c)+1)
+        y = range(int(box[2]//c), int(box[3]//c)+1)
+        z = range(int(box[4]//c), int(box[5]//c)+1)
+        if len(x)*len(y)*len(z) > self.spread: return None
+        return [(i, j, k) for i in x for j in y for k in z]
+
+    def incident(self, i, j):
+        a, b = self.segments[i], self.segments[j]
+        return a[0] in b or a[1] in b
+
+    def collisions(self, xs, ys, zs, skip=()):
+        # returns (depth, i, j) for every colliding non-incident pair, ordered by (i, j)
+        boxes = self.boxes(xs, ys, zs)
+        grid = collections.defaultdict(list)
+        large = []
+        for i, box in enumerate(boxes):
+            if box is None: continue
+            cells = self.cells(box)
+            if cells is None:
+                large.append(i)
+                continue
+            for c in cells:
+                grid[c].append(i)
+
+        candidates = set()
+        for members in grid.values():
+            for a in range(len(members)):
+                for b in range(a+1, len(members)):
+                    candidates.add((members[a], members[b]))
+        for i in large:
+            for j, box in enumerate(boxes):
+                if box is not None and i != j:
+                    candidates.add((min(i, j), max(i, j)))
+
+        found = []
+        for i, j in candidates:
+            if (i, j) in skip or self.incident(i, j): continue
+            depth = overlap(boxes[i], boxes[j])
+            if depth is not None:
+                found.append((depth, i, j))
+        found.sort(key=lambda f: (f[1], f[2]))
+        return found
+
+def overlap(a, b):
+    # depth of the intersection of two boxes, None if they are apart
+    depth = 0
+    for axis in (0, 2, 4):
+        lo, hi = max(a[axis], b[axis]), min(a[axis+1], b[axis+1])
+        if hi < lo: return None
+        depth += hi - lo
+    return depth
+
+class Index(Detector):
+    # segments given by their end positions and added one at a time, each new one checked against those in
+    def __init__(self, cell=1, spread=64):
+        Detector.__init__(self, [], cell, spread)
+        self.grid = collections.defaultdict(list)
+        self.placed = []
+        self.large = []
+
+    def box(self, a, b):
+        return tuple(f(a[axis], b[axis]) for axis in range(3) for f in (min, max))
+
+    def add(self, a, b):
+        box = self.box(a, b)
+        self.placed.append(box)
+        cells = self.cells(box)
+        if cells is None:
+            self.large.append(box)
+            return
+        for c in cells:
+            self.grid[c].append(box)
+
+    def hits(self, a, b):
+        # whether the segment from a to b touches any segment added
+        box = self.box(a, b)
+        cells = self.cells(box)
+        near = self.placed if cells is None else self.large + [other for c in cells for other in self.grid.get(c, ())]
+        return any([overlap(box, other) is not None for other in near])
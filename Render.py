@@ -0,0 +1,481 @@
+#!/usr/bin/env python
+
+import os
+import argparse
+import enum
+import functools
+import collections
+import heapq
+import gzip
+import json
+import shutil
+import tempfile
+from xml.sax.saxutils import escape
+
+import svgwrite
+from svgwrite import cm
+
+class Direction(enum.IntEnum):
+    north=0
+    east=1
+    up=2
+    south=3
+    west=4
+    down=5
+    mod=6
+    def invert(self):
+        return Direction((self + self.mod/2)%self.mod)
+
+direction_matrix = [Direction.north,
+                    Direction.east,
+                    Direction.south,
+                    Direction.west,
+                    Direction.up,
+                    Direction.down]
+
+class Room():
+    __slots__ = ('vnum', 'name', 'desc', 'exits', 'fixups', 'dummy', 'x', 'y', 'z')
+
+    def __init__(self, r):
+        self.vnum = r[0]
+        self.name = r[1]
+        self.desc = r[2]
+        self.exits = [] if not r[3] else [Exit(e, self.vnum) for e in r[3] if e is not None]
+        self.fixups = []
+        self.dummy = False
+        self.x = self.y = self.z = None
+
+    def replace_exit(self, orig, replacement, distance):
+        for e in self.exits:
+            if e.n_room == orig:
+                e.n_room = replacement
+                e.distance += distance
+
+    def __repr__(self):
+        return '[%d: %s] {%s}'%(self.vnum, self.name, self.exits)
+            
+class Exit():
+    __slots__ = ('p_room', 'n_room', 'direction', 'distance', 'one_way', 'reverse')
+
+    def __init__(self, e, source, fake=False, distance=1):
+        self.p_room = source
+        self.n_room = e[1]
+        self.direction = Direction(direction_matrix[e[0]])
+        self.distance = distance
+        self.one_way = False
+        self.reverse = None
+
+    def __eq__(self, e):
+        if self.p_room == e.p_room and self.n_room == e.n_room and \
+           self.direction == e.direction: return True
+        if self.p_room == e.n_room and self.n_room == e.p_room and \
+           self.direction == e.direction.invert(): return True
+        return False
+
+    def __contains__(self, e):
+        return e in (self.p_room, self.n_room)
+
+    def __repr__(self):
+        return '%d -> %d (%d %s)'%(self.p_room, self.n_room, self.distance, self.direction.name)
+
+    def key(self):
+        # orientation independent identity, the same for both halves of a two-way exit
+        r0, r1, d = (self.p_room, self.n_room, self.direction) if self.p_room < self.n_room \
+            else (self.n_room, self.p_room, self.direction.invert())
+        return r0, r1, d, self.distance
+
+    def __hash__(self):
+        return hash(self.key()[:3])
+
+def step(d, dist):
+    return ((dist if d == Direction.east else -dist if d == Direction.west else 0),
+            (dist if d == Direction.north else -dist if d == Direction.south else 0),
+            (dist if d == Direction.up else -dist if d == Direction.down else 0))
+
+class Plotter():
+    lift = 0.15
+    colors = ['red', 'orange', 'yellow', 'green', 'blue', 'indigo', 'violet']
+
+    def proj_room(self, room):
+        if None in (room.x, room.y, room.z): return None
+        return (2 + room.x + self.lift*room.z,
+                2+self.lift*self.z_max + (self.y_max - room.y) - self.lift*room.z)
+
+    def proj_exit(self, ex):
+        if None in (self.rdb[ex.p_room].x, self.rdb[ex.p_room].y, self.rdb[ex.p_room].z): return None
+        start = (2 + self.rdb[ex.p_room].x + .25 + self.lift*self.rdb[ex.p_room].z,
+                 2+self.lift*self.z_max + (self.y_max - self.rdb[ex.p_room].y) + .25 - self.lift*self.rdb[ex.p_room].z)
+
+        if ex.n_room in self.rdb.keys():
+            if None in (self.rdb[ex.n_room].x, self.rdb[ex.n_room].y, self.rdb[ex.n_room].z): return None
+            end = (2 + self.rdb[ex.n_room].x + .25 + self.lift*self.rdb[ex.n_room].z,
+                   2+self.lift*self.z_max + (self.y_max - self.rdb[ex.n_room].y) + .25 - self.lift*self.rdb[ex.n_room].z)
+        else:
+            if ex.direction == Direction.north:
+                end = (start[0], start[1]-1)
+            elif ex.direction == Direction.east:
+                end = (start[0]+1, start[1])
+            elif ex.direction == Direction.south:
+                end = (start[0], start[1]+1)
+            elif ex.direction == Direction.west:
+                end = (start[0]-1, start[1])
+            elif ex.direction == Direction.up:
+                end = (start[0]+self.lift, start[1]-self.lift)
+            elif ex.direction == Direction.down:
+                end = (start[0]-self.lift, start[1]+self.lift)
+
+        return (start, end)
+
+    def __init__(self, name, rdb, exits):
+        self.name = name
+        self.rdb = rdb
+        self.exits = exits
+
+    def extent(self):
+        # canvas size in cm, room coordinates start at 0 on every axis
+        self.x_max = max([r.x for r in self.rdb.values()])
+        self.y_max = max([r.y for r in self.rdb.values()])
+        self.z_max = max([r.y for r in self.rdb.values()])
+        z_space = self.z_max*self.lift
+        return (self.x_max+4+11+z_space, self.y_max+4+4+z_space)
+
+    def layers(self):
+        # exits and rooms bottom level first, an exit goes under the rooms of the highest level it touches
+        # both are sorted on their own and merged in one pass, exits before rooms of the same level
+        exits = sorted(self.exits, key=lambda x: max(self.rdb[x.p_room].z, self.rdb[x.n_room].z))
+        rooms = sorted(self.rdb.values(), key=lambda r: r.z)
+        return heapq.merge(((max(self.rdb[ex.p_room].z, self.rdb[ex.n_room].z), 0, ex) for ex in exits),
+                           ((room.z, 1, room) for room in rooms), key=lambda item: item[:2])
+
+    def plot(self):
+        width, height = self.extent()
+        dwg = svgwrite.Drawing(self.name, profile='full', size=(width*cm, height*cm),
+                               viewBox='0 0 %d %d'%(width, height))
+        descs = []
+
+        for z, kind, item in self.layers():
+            if kind == 0:
+                ex = item
+                projection = self.proj_exit(ex)
+                color = 'red' if ex.one_way else 'black'
+                dwg.add(dwg.line(start=projection[0], end=projection[1], stroke_width=.05, stroke=color))
+            else:
+                room = item
+                if room.dummy: continue
+                projection = self.proj_room(room)
+                g = dwg.g(visibility='hidden')
+                etext = 'Exits: ' + ', '.join([ex.direction.name for ex in room.exits])
+                desc = room.desc.split('\n')+[etext]
+                g.add(dwg.rect(fill='white', insert=(projection[0]+.5, projection[1]+.5), size=(11,2+len(desc)/3),
+                               stroke='black', stroke_width=0.05))
+                text = dwg.text('', insert=(projection[0]+.7, projection[1]+1.1), #size=(100,100),
+                                font_size='.3', font_family='Arial', fill='black')
+                text.add(dwg.tspan(room.name, font_size='.4'))
+                for line in desc:
+                    text.add(dwg.tspan(line, x=[projection[0]+.7], dy=['1.4em']))
+                g.add(text)
+                r = dwg.rect(insert=projection, size=(.5,.5),
+                             fill=self.colors[min(6, int(room.z))], stroke='black', stroke_width=0.025)
+                s = dwg.set(to='visible')
+                s.set_target('visibility')
+                s.set_timing(begin=r.get_id()+'.mouseover', end=r.get_id()+'.mouseout')
+                g.add(s)
+                dwg.add(r)
+                descs.append(g)
+
+        # add these after so they float above
+        for g in descs: dwg.add(g)
+
+        dwg.save()
+        return
+
+class StreamPlotter(Plotter):
+    # the drawing of Plotter written element by element instead of built as one svgwrite document
+    # descriptions are spooled to a temporary file on the way and appended last so they float above
+    def open(self, name=None):
+        # .svgz names are written gzipped
+        name = name or self.name
+        if name.endswith('.svgz'): return gzip.open(name, 'wt', encoding='utf-8')
+        return open(name, 'w', encoding='utf-8')
+
+    def plot(self):
+        width, height = self.extent()
+        with self.open() as f, tempfile.TemporaryFile('w+') as descs:
+            f.write('<?xml version="1.0" encoding="utf-8" ?>\n'
+                    '<svg baseProfile="full" height="%scm" version="1.1" viewBox="0 0 %d %d" width="%scm" '
+                    'xmlns="http://www.w3.org/2000/svg" xmlns:ev="http://www.w3.org/2001/xml-events" '
+                    'xmlns:xlink="http://www.w3.org/1999/xlink"><defs />'%(height, width, height, width))
+            for z, kind, item in self.layers():
+                if kind == 0:
+                    projection = self.proj_exit(item)
+                    if projection is None: continue
+                    (x1, y1), (x2, y2) = projection
+                    f.write('<line stroke="%s" stroke-width="0.05" x1="%s" x2="%s" y1="%s" y2="%s" />'%(
+                        'red' if item.one_way else 'black', x1, x2, y1, y2))
+                    continue
+                room = item
+                if room.dummy: continue
+                projection = self.proj_room(room)
+                if projection is None: continue
+                x, y = projection
+                ident = 'room%d'%(room.vnum)
+                f.write('<rect fill="%s" height="0.5" id="%s" stroke="black" stroke-width="0.025" width="0.5" '
+                        'x="%s" y="%s" />'%(self.colors[min(6, int(room.z))], ident, x, y))
+                desc = room.desc.split('\n') + ['Exits: ' + ', '.join([ex.direction.name for ex in room.exits])]
+                descs.write('<g visibility="hidden"><rect fill="white" height="%s" stroke="black" stroke-width="0.05" '
+                            'width="11" x="%s" y="%s" />'%(2+len(desc)/3, x+.5, y+.5))
+                descs.write('<text fill="black" font-family="Arial" font-size=".3" x="%s" y="%s">'
+                            '<tspan font-size=".4">%s</tspan>'%(x+.7, y+1.1, escape(room.name)))
+                for line in desc:
+                    descs.write('<tspan dy="1.4em" x="%s">%s</tspan>'%(x+.7, escape(line)))
+                descs.write('</text><set attributeName="visibility" begin="%s.mouseover" end="%s.mouseout" '
+                            'to="visible" /></g>'%(ident, ident))
+            descs.seek(0)
+            shutil.copyfileobj(descs, f)
+            f.write('</svg>\n')
+
+class CompactPlotter(StreamPlotter):
+    # the drawing of Plotter with styles in CSS classes, rooms as uses of one symbol and exits of a level
+    # batched into one path per colour; a single tooltip is filled by a script from a description table
+    # indexed by the data-i of the room under the pointer, descriptions shared by several rooms are stored once
+    style = ('.e{fill:none;stroke:black;stroke-width:.05}.o{stroke:red}'
+             'use{stroke:black;stroke-width:.025}%s'
+             '#tip rect{fill:white;stroke:black;stroke-width:.05}#tip text{font:.3px Arial}#tip .n{font-size:.4px}')
+    script = '''(function(){
+var svg=document.documentElement;
+var table=JSON.parse(document.getElementById('rooms').textContent),rooms=table.rooms;
+var tip=document.getElementById('tip'),box=tip.firstElementChild,text=box.nextElementSibling;
+var ns='http://www.w3.org/2000/svg';
+function span(s,x,dy,c){var t=document.createElementNS(ns,'tspan');t.textContent=s;
+if(x!==null){t.setAttribute('x',x);t.setAttribute('dy',dy);}if(c)t.setAttribute('class',c);text.appendChild(t);}
+svg.addEventListener('mouseover',function(ev){var i=ev.target.getAttribute&&ev.target.getAttribute('data-i');
+if(i===null||i===undefined)return;var r=rooms[i],x=+ev.target.getAttribute('x'),y=+ev.target.getAttribute('y');
+while(text.firstChild)text.removeChild(text.firstChild);
+var lines=table.descs[r[1]].split('\\n').concat(['Exits: '+r[2]]);
+box.setAttribute('x',x+.5);box.setAttribute('y',y+.5);box.setAttribute('height',2+lines.length/3);
+text.setAttribute('x',x+.7);text.setAttribute('y',y+1.1);span(r[0],null,null,'n');
+for(var l=0;l<lines.length;l++)span(lines[l],x+.7,'1.4em');tip.setAttribute('visibility','visible');});
+svg.addEventListener('mouseout',function(ev){if(ev.target.getAttribute&&ev.target.getAttribute('data-i')!==null)
+tip.setAttribute('visibility','hidden');});})();'''
+
+    @staticmethod
+    def number(v):
+        return ('%.3f'%(v)).rstrip('0').rstrip('.')
+
+    def begin(self, f, view, width, height):
+        levels = ''.join(['.z%d{fill:%s}'%(z, c) for z, c in enumerate(self.colors)])
+        f.write('<?xml version="1.0" encoding="utf-8" ?>\n'
+                '<svg height="%scm" version="1.1" viewBox="%s" width="%scm" '
+                'xmlns="http://www.w3.org/2000/svg"><style>%s</style><defs><symbol id="r" overflow="visible">'
+                '<rect height=".5" width=".5" /></symbol></defs>'%(height, view, width, self.style%(levels)))
+
+    def describe(self, room, table, descs):
+        # index of a room in the description table, its data-i
+        table.append([room.name, descs.setdefault(room.desc, len(descs)),
+                      ', '.join([ex.direction.name for ex in room.exits])])
+        return len(table) - 1
+
+    def end(self, f, table, descs):
+        # the table is JSON inside CDATA, a closing ]]> in a description is broken up
+        f.write('<g id="tip" visibility="hidden" pointer-events="none"><rect width="11" /><text /></g>'
+                '<script id="rooms" type="application/json"><![CDATA[%s]]></script>'
+                '<script><![CDATA[%s]]></script></svg>\n'%(
+                    json.dumps({'rooms': table, 'descs': list(descs)}).replace(']]>', ']]\\u003e'), self.script))
+
+    def plot(self):
+        width, height = self.extent()
+        table = []
+        descs = {}
+        with self.open() as f:
+            self.begin(f, '0 0 %d %d'%(width, height), width, height)
+            paths = collections.defaultdict(list)
+            def flush():
+                for one_way, d in sorted(paths.items()):
+                    f.write('<path class="e%s" d="%s" />'%(' o' if one_way else '', ''.join(d)))
+                paths.clear()
+            for z, kind, item in self.layers():
+                if kind == 0:
+                    projection = self.proj_exit(item)
+                    if projection is None: continue
+                    paths[bool(item.one_way)].append('M%s %sL%s %s'%tuple(self.number(v) for p in projection for v in p))
+                    continue
+                flush()
+                room = item
+                if room.dummy: continue
+                projection = self.proj_room(room)
+                if projection is None: continue
+                f.write('<use class="z%d" data-i="%d" href="#r" x="%s" y="%s" />'%(
+                    min(6, int(room.z)), self.describe(room, table, descs),
+                    self.number(projection[0]), self.number(projection[1])))
+            flush()
+            self.end(f, table, descs)
+
+class TilePlotter(CompactPlotter):
+    # every level drawn flat on its own and cut into size x size tiles; overview k draws blocks of 2^k x 2^k
+    # rooms as one cell and is added until a single tile holds the whole map
+    # tiles go to a directory named like the output as z<level>/<k>/<column>_<row>.svg, listed in manifest.json
+    version = 1
+    stub = .4
+
+    def __init__(self, name, rdb, exits, size=32):
+        super().__init__(name, rdb, exits)
+        self.size = size
+
+    def level(self, z):
+        # rooms of a level by position, its exits as segments between room positions, and stubs pointing
+        # the way of exits leaving the level or the component
+        at = lambda r: (round(r.x), round(r.y))
+        rooms = {at(r): r for r in self.rdb.values() if round(r.z) == z and not r.dummy}
+        segments = []
+        stubs = []
+        for ex in self.exits:
+            p, n = self.rdb[ex.p_room], self.rdb[ex.n_room]
+            ends = [(room, sign) for room, sign in ((p, 1), (n, -1)) if not room.dummy and round(room.z) == z]
+            if len(ends) == 2:
+                segments.append(at(p) + at(n) + (bool(ex.one_way),))
+                continue
+            # an exit arriving from another level gets its stub at n_room, pointing back the way it came
+            for room, sign in ends:
+                dx, dy, dz = step(ex.direction, sign)
+                dx, dy = (dx, dy) if dz == 0 else (self.lift*dz, self.lift*dz)
+                x, y = at(room)
+                stubs.append((x, y, x + self.stub*dx, y + self.stub*dy, bool(ex.one_way)))
+        return rooms, segments, stubs
+
+    def coarse(self, rooms, segments, block):
+        # cells of blocks holding any room and the exits between different blocks
+        cells = {(x//block, y//block): None for x, y in rooms}
+        links = set([(x1//block, y1//block, x2//block, y2//block, one_way) for x1, y1, x2, y2, one_way in segments
+                     if (x1//block, y1//block) != (x2//block, y2//block)])
+        return cells, sorted(links)
+
+    def tile(self, path, column, row, cells, segments, top, z):
+        # cells map positions to rooms (None for blocks), y grows upwards below top, drawn flipped
+        table = []
+        descs = {}
+        size = self.size
+        with self.open(path) as f:
+            self.begin(f, '%d %d %d %d'%(column*size, row*size, size, size), size, size)
+            paths = collections.defaultdict(list)
+            for x1, y1, x2, y2, one_way in segments:
+                paths[one_way].append('M%s %sL%s %s'%tuple(self.number(v) for v in
+                                                            (x1+.5, top-y1+.5, x2+.5, top-y2+.5)))
+            for one_way, d in sorted(paths.items()):
+                f.write('<path class="e%s" d="%s" />'%(' o' if one_way else '', ''.join(d)))
+            for (x, y), room in cells:
+                if room is None:
+                    f.write('<use class="z%d" href="#r" x="%s" y="%s" />'%(min(6, z), x+.25, top-y+.25))
+                    continue
+                f.write('<use class="z%d" data-i="%d" href="#r" x="%s" y="%s" />'%(
+                    min(6, z), self.describe(room, table, descs), x+.25, top-y+.25))
+            # overviews have nothing to describe
+            if len(table): self.end(f, table, descs)
+            else: f.write('</svg>\n')
+
+    def plot(self):
+        directory, ext = os.path.splitext(self.name)
+        ext = ext or '.svg'
+        width = round(max([r.x for r in self.rdb.values()])) + 1
+        height = round(max([r.y for r in self.rdb.values()])) + 1
+        manifest = {'version': self.version, 'tile': self.size, 'width': width, 'height': height, 'levels': {}}
+        for z in sorted(set([round(r.z) for r in self.rdb.values() if not r.dummy])):
+            rooms, segments, stubs = self.level(z)
+            overviews = []
+            block = 1
+            while True:
+                if block == 1:
+                    cells, links = rooms, segments + stubs
+                else:
+                    cells, links = self.coarse(rooms, segments, block)
+                # blocks are size units apart on every overview, rows count from the top
+                top = (height - 1)//block
+                columns, rows = (width - 1)//block//self.size + 1, top//self.size + 1
+                tiles = collections.defaultdict(lambda: ([], []))
+                for (x, y), room in cells.items():
+                    tiles[(x//self.size, (top - y)//self.size)][0].append(((x, y), room))
+                for s in links:
+                    xs, ys = (s[0], s[2]), (top - s[1], top - s[3])
+                    for column in range(int(min(xs)+.5)//self.size, int(max(xs)+.5)//self.size + 1):
+                        for row in range(int(min(ys)+.5)//self.size, int(max(ys)+.5)//self.size + 1):
+                            tiles[(column, row)][1].append(s)
+                level = os.path.join('z%d'%(z), str(len(overviews)))
+                os.makedirs(os.path.join(directory, level), exist_ok=True)
+                names = []
+                for (column, row), (tile_cells, tile_links) in sorted(tiles.items()):
+                    name = os.path.join(level, '%d_%d%s'%(column, row, ext))
+                    self.tile(os.path.join(directory, name), column, row, tile_cells, tile_links, top, z)
+                    names.append([column, row, name])
+                overviews.append({'block': block, 'columns': columns, 'rows': rows, 'tiles': names})
+                if columns == 1 and rows == 1: break
+                block *= 2
+            manifest['levels'][str(z)] = {'rooms': len(rooms), 'overviews': overviews}
+        with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+
+
+LAYOUT_VERSION = 1
+LAYOUT_EXT = '.layout.json'
+
+def write_layout(path, area, rdb, exits, restored=()):
+    # solved positions of a component with everything the plotters read, rooms as
+    # [vnum, x, y, z, name, desc, dummy, restored, [[direction, target, distance, one_way], ...]]
+    # and drawn exits as [source, target, direction, distance, one_way], directions as area file codes
+    code = lambda d: direction_matrix.index(d)
+    restored = set(restored)
+    layout = {'version': LAYOUT_VERSION, 'area': area[1] if area else '',
+              'rooms': [[r.vnum, r.x, r.y, r.z, r.name, r.desc, r.dummy, r.vnum in restored,
+                         [[code(e.direction), e.n_room, e.distance, e.one_way] for e in r.exits]]
+                        for r in rdb.values()],
+              'exits': [[e.p_room, e.n_room, code(e.direction), e.distance, e.one_way] for e in exits]}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(layout, f, separators=(',', ':'))
+
+def read_layout(path):
+    # (area name, rooms by vnum, drawn exits, restored vnums) of a layout file
+    with open(path, 'r', encoding='utf-8') as f:
+        layout = json.load(f)
+    if layout.get('version') != LAYOUT_VERSION:
+        raise ValueError('%s: layout version %s, expected %d'%(path, layout.get('version'), LAYOUT_VERSION))
+    def exit(e, source):
+        ex = Exit((e[0], e[1]), source, distance=e[2])
+        ex.one_way = e[3]
+        return ex
+    rdb = {}
+    for vnum, x, y, z, name, desc, dummy, restored, exits in layout['rooms']:
+        room = Room((vnum, name, desc, None))
+        room.x, room.y, room.z = x, y, z
+        room.dummy = dummy
+        room.exits = [exit(e, vnum) for e in exits]
+        rdb[vnum] = room
+    exits = [exit((d, n, distance, one_way), p) for p, n, d, distance, one_way in layout['exits']]
+    return layout['area'], rdb, exits, [r[0] for r in layout['rooms'] if r[7]]
+
+def arguments(cli):
+    cli.add_argument('--writer', choices=('dom', 'stream', 'compact', 'tiles'), default='dom',
+                     help='stream writes the svg as it is drawn instead of building it in memory first, compact '
+                          'also moves styles to CSS and descriptions to one shared tooltip (.svgz output is gzipped), '
+                          'tiles writes every level flat as tiles and overviews into a directory named like the output')
+    cli.add_argument('--tile-size', metavar='ROOMS', type=int, default=32,
+                     help='rooms across a tile of --writer tiles')
+
+def plotter(args):
+    # plotter class for the --writer and --tile-size arguments
+    if args.writer == 'tiles':
+        return functools.partial(TilePlotter, size=args.tile_size)
+    return {'dom': Plotter, 'stream': StreamPlotter, 'compact': CompactPlotter}[args.writer]
+
+def main():
+    cli = argparse.ArgumentParser(description='Plot layouts exported by Mapper.py --export, no solver needed.')
+    cli.add_argument('layouts', nargs='+', help='layout files, each plotted next to itself')
+    cli.add_argument('--ext', default='.svg', help='extension of the plots (.svgz output is gzipped)')
+    arguments(cli)
+    args = cli.parse_args()
+    plot = plotter(args)
+    for path in args.layouts:
+        area, rdb, exits, restored = read_layout(path)
+        name = (path[:-len(LAYOUT_EXT)] if path.endswith(LAYOUT_EXT) else os.path.splitext(path)[0]) + args.ext
+        plot(name, rdb, exits).plot()
+        print('%s [+] %s plotted from %s.'%(area, name, path))
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+import array
+
+ONE_WAY = 1
+OUTSIDE = 2
+
+class RoomGraph():
+    # rooms numbered densely in file order, their exits in flat arrays sliced per room (CSR)
+    # exits of room i are offsets[i]:offsets[i+1], directions are the area file codes (n e s w u d)
+    # targets are room indices, or -1 with the vnum kept in vnums_out for exits leaving the graph
+    # reverse holds the exit leading back for every exit, -1 when there is none
+    def __init__(self):
+        self.vnums = array.array('l')
+        self.names = []
+        self.descs = []
+        self.index = {}
+        self.offsets = array.array('l', [0])
+        self.source = array.array('l')
+        self.target = array.array('l')
+        self.vnums_out = array.array('l')
+        self.direction = array.array('b')
+        self.distance = array.array('l')
+        self.flags = array.array('B')
+        self.reverse = array.array('l')
+
+    @classmethod
+    def from_records(cls, rooms):
+        # rooms as the parsers return them, (vnum, name, desc, exits, ...)
+        g = cls()
+        for i, r in enumerate(rooms):
+            g.index[r[0]] = i
+            g.vnums.append(r[0])
+            g.names.append(r[1])
+            g.descs.append(r[2])
+        for i, r in enumerate(rooms):
+            for e in r[3] or []:
+                if e is None: continue
+                g.source.append(i)
+                g.target.append(g.index.get(e[1], -1))
+                g.vnums_out.append(e[1])
+                g.direction.append(e[0])
+                g.distance.append(1)
+            g.offsets.append(len(g.source))
+        g.link()
+        return g
+
+    def __len__(self):
+        return len(self.vnums)
+
+    def exits(self, i):
+        return range(self.offsets[i], self.offsets[i+1])
+
+    def link(self):
+        # pair every exit with the one leading back, a loop is its own way back
+        # and flag one-ways, maze exits (several between the same two rooms) and exits leaving the graph
+        back = {}
+        for e in range(len(self.source)):
+            if self.target[e] >= 0:
+                back[(self.source[e], self.target[e], self.direction[e])] = e
+        self.flags = array.array('B', bytes(len(self.source)))
+        self.reverse = array.array('l', [-1])*len(self.source)
+        for i in range(len(self)):
+            exits = self.exits(i)
+            for e in exits:
+                t = self.target[e]
+                if t < 0:
+                    self.flags[e] |= OUTSIDE
+                    continue
+                self.reverse[e] = e if t == i else back.get((t, i, (self.direction[e] + 2)%4 if self.direction[e] < 4
+                                                             else 9 - self.direction[e]), -1)
+                parallel = len([f for f in exits if self.target[f] == t or t == i])
+                if self.reverse[e] < 0 or parallel > 1:
+                    self.flags[e] |= ONE_WAY
+
+    def components(self):
+        # weakly connected components as sorted lists of room indices, largest first, ties in file order
+        # union-find over the exits with path halving and union by size
+        parent = list(range(len(self)))
+        size = [1]*len(self)
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        for e in range(len(self.source)):
+            if self.target[e] < 0: continue
+            a, b = find(self.source[e]), find(self.target[e])
+            if a == b: continue
+            if size[a] < size[b]: a, b = b, a
+            parent[b] = a
+            size[a] += size[b]
+        members = {}
+        for i in range(len(self)):
+            members.setdefault(find(i), []).append(i)
+        return sorted(members.values(), key=lambda m: (-len(m), m[0]))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import time
+import shutil
+import subprocess
+
+import Matrix
+
+NAMES = ('cbc', 'glpk', 'highs')
+
+# persistent pyomo plugins --persistent can keep a model loaded in
+PERSISTENT = ('gurobi_persistent', 'cplex_persistent', 'xpress_persistent')
+
+# pyomo plugin of every backend and its option names for the gap, threads and time limit, persistent ones included
+PYOMO = {'cbc': 'cbc', 'glpk': 'glpk', 'highs': 'appsi_highs'}
+OPTIONS = {'cbc': ('ratio', 'threads', 'sec'),
+           'glpk': ('mipgap', None, 'tmlim'),
+           'highs': ('mip_rel_gap', 'threads', 'time_limit'),
+           'gurobi_persistent': ('MIPGap', 'Threads', 'TimeLimit'),
+           'cplex_persistent': ('mip_tolerances_mipgap', 'threads', 'timelimit'),
+           'xpress_persistent': ('miprelstop', 'threads', 'maxtime')}
+
+# rooms in the models timed by benchmark()
+SIZES = (25, 100, 400)
+
+def available(name):
+    if name == 'highs':
+        try:
+            import highspy
+            return True
+        except ImportError:
+            return False
+    return shutil.which({'cbc': 'cbc', 'glpk': 'glpsol'}[name]) is not None
+
+def factory(name, gap=.05, threads=None):
+    # pyomo solver for a backend with its gap and thread options set
+    from pyomo.opt import SolverFactory
+    solver = SolverFactory(PYOMO.get(name, name))
+    ratio, parallel = OPTIONS[name][:2]
+    solver.options[ratio] = gap
+    if threads and parallel: solver.options[parallel] = threads
+    return solver
+
+def limit(solver, name, seconds):
+    # wall-clock limit of the next solve, glpk only takes whole seconds
+    option = OPTIONS[name][2]
+    if seconds is None:
+        solver.options.pop(option, None)
+        return
+    solver.options[option] = max(1, int(seconds)) if name == 'glpk' else max(.01, seconds)
+
+def synthetic(rooms):
+    # rooms on a line that must not share a spot with the next two, the disjunctions crossing rows make in miniature
+    model = Matrix.Model()
+    M = 2*rooms
+    x = [model.var(0, M) for i in range(rooms)]
+    top = model.var(0, M, cost=1)
+    for i, j in [(i, j) for i in range(rooms) for j in (i+1, i+2) if j < rooms]:
+        b = model.var(0, 1)
+        model.row([(x[i], 1), (x[j], -1), (b, -M)], lo=1 - M)
+        model.row([(x[j], 1), (x[i], -1), (b, M)], lo=1)
+    for i in range(rooms):
+        model.row([(top, 1), (x[i], -1)], lo=0)
+    return model
+
+def benchmark(names=None, sizes=SIZES, gap=.05, threads=None, budget=10):
+    # fastest available backend per model size as [[rooms, name], ...], smallest size first
+    names = [n for n in (names or NAMES) if available(n)]
+    table = []
+    for rooms in sizes:
+        timings = {}
+        for name in names:
+            start = time.time()
+            try:
+                status = Matrix.solver(name, gap, threads).solve(synthetic(rooms), time_limit=budget)
+            except (OSError, RuntimeError, subprocess.CalledProcessError):
+                continue
+            if status in ('optimal', 'limit'):
+                timings[name] = time.time() - start + (budget if status == 'limit' else 0)
+        print('[!] Benchmark of %d rooms: %s'%(rooms, ', '.join(['%s %.2fs'%(n, t) for n, t in sorted(timings.items())])
+                                                 or 'no backend available'))
+        if len(timings): table.append([rooms, min(timings, key=timings.get)])
+    return table
+
+def load(path, **kwargs):
+    # benchmark table kept as JSON in path, run once when missing or unreadable
+    if path is not None:
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+    table = benchmark(**kwargs)
+    if path is not None:
+        with open(path, 'w') as f:
+            json.dump(table, f)
+    return table
+
+def pick(table, rooms, default='cbc'):
+    # backend that won the largest benchmarked size not above the model, or the smallest size
+    chosen = table[0][1] if len(table) else default
+    for size, name in table:
+        if size <= rooms: chosen = name
+    return chosen
+
+def main():
+    table = benchmark(sys.argv[1:] or None)
+    for rooms, name in table:
+        print('%d rooms: %s'%(rooms, name))
+
+if __name__=='__main__':
+    main()
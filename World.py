@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+import sys
+import os
+import glob
+import multiprocessing
+
+import AreaParser
+import RoomGraph
+
+def read(job):
+    # pool worker: parse one area file, keeping the sections the tools use
+    path, backend, compiled = job
+    if compiled is not None:
+        sections = dict(compiled.load(path, backend))
+    elif backend == 'fast':
+        with open(path, 'r') as f:
+            sections = dict(AreaParser.Reader().parse(f.read()))
+    else:
+        with open(path, 'r') as f:
+            sections = dict(AreaParser.Parser().parse(f.read()))
+    return path, sections.get('#AREA'), sections.get('#ROOMS') or [], \
+        sections.get('#RESETS') or [], sections.get('#SHOPS') or []
+
+class World():
+    # every area of a directory parsed once, with one vnum index across all of them
+    def __init__(self):
+        self.areas = {}
+        self.rooms = {}
+        self.resets = {}
+        self.shops = {}
+        self.index = {}
+
+    @classmethod
+    def load(cls, directory, jobs=1, backend='fast', compiled=None):
+        # compiled is an AreaParser.Compiled store, files unchanged since it was filled are not parsed again
+        world = cls()
+        files = sorted(glob.glob(os.path.join(directory, '*.are')))
+        work = [(path, backend, compiled) for path in files]
+        if jobs > 1 and len(files) > 1:
+            with multiprocessing.Pool(jobs) as pool:
+                results = pool.map(read, work)
+        else:
+            results = map(read, work)
+        for result in results:
+            world.add(*result)
+        return world
+
+    def add(self, path, area, rooms, resets, shops):
+        self.areas[path] = area
+        self.rooms[path] = rooms
+        self.resets[path] = resets
+        self.shops[path] = shops
+        duplicates = 0
+        for i, r in enumerate(rooms):
+            if r[0] in self.index:
+                duplicates += 1
+                continue
+            self.index[r[0]] = (path, i)
+        if duplicates:
+            print('[-] %s: %d rooms already defined by other areas, ignored.'%(path, duplicates))
+
+    def find(self, path):
+        # area loaded from a file, matched by file name
+        for p in self.areas:
+            if os.path.basename(p) == os.path.basename(path): return p
+        return None
+
+    def graph(self):
+        # every room of the world in one RoomGraph, exits between areas included
+        return RoomGraph.RoomGraph.from_records([r for path in self.rooms for i, r in enumerate(self.rooms[path])
+                                                 if self.index[r[0]] == (path, i)])
+
+    def room(self, vnum):
+        if vnum not in self.index: return None
+        path, i = self.index[vnum]
+        return self.rooms[path][i]
+
+    def owner(self, vnum):
+        # area header of the area a room belongs to
+        if vnum not in self.index: return None
+        return self.areas[self.index[vnum][0]]
+
+    def crossings(self, path):
+        # exits of an area leading into other areas, as (vnum, direction, target, target area)
+        found = []
+        for r in self.rooms[path]:
+            for e in r[3] or []:
+                if e is None or e[1] in self.index and self.index[e[1]][0] == path: continue
+                found.append((r[0], e[0], e[1], self.owner(e[1])))
+        return found
+
+def main():
+    compiled = AreaParser.Compiled(sys.argv[2]) if len(sys.argv) > 2 else None
+    backend = sys.argv[3] if len(sys.argv) > 3 else 'fast'
+    world = World.load(sys.argv[1], multiprocessing.cpu_count(), backend, compiled)
+    components = world.graph().components()
+    print('%d rooms in %d connected components, largest %d'%(len(world.index), len(components),
+                                                             len(components[0]) if len(components) else 0))
+    for path in world.areas:
+        crossings = world.crossings(path)
+        print('%s: %d rooms, %d exits out, %d unresolved'%(path, len(world.rooms[path]), len(crossings),
+                                                            len([c for c in crossings if c[3] is None])))
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,131 @@
+import os
+import sys
+import glob
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import AreaParser
+
+# a room with a door and an extra description, one with three doors, and every section around them
+SAMPLE = """#AREA
+test.are~
+Test Area~
+{ 1 50} Builder Test~
+3000 3099
+
+#MOBILES
+#3000
+wizard~
+the wizard~
+A wizard walks around.
+~
+He looks wise.
+~
+human~
+ABT DFH 900 0
+30 0 1d1+999 1d1+99 1d8+30 claw
+-10 -10 -10 -10
+0 0 0 0
+stand stand male 0
+0 0 medium 0
+F for AB
+#0
+
+#OBJECTS
+#3000
+sword~
+a sword~
+A sword lies here.~
+steel~
+weapon 0 AN
+sword 10 4 slash 0
+5 10 100 P
+E
+sword~
+A fine sword.
+~
+A
+18 2
+#0
+
+#ROOMS
+#3000
+Grid 0 0~
+A room.
+With two lines.
+~
+0 0 0
+D1
+A door.
+~
+door~
+0 0 3001
+D0
+A door.
+~
+door~
+0 0 3005
+E
+sign~
+A sign.
+~
+S
+#3001
+Grid 1 0~
+A room.
+With two lines.
+~
+0 0 0
+D1
+A door.
+~
+door~
+0 0 3002
+D3
+A door.
+~
+door~
+0 0 3000
+D0
+A door.
+~
+door~
+0 0 3006
+S
+#0
+
+#RESETS
+M 0 3000 1 3001 1
+O 0 3000 0 3000 * sword
+S
+
+#SHOPS
+3000 2 3 0 0 0 100 100 0 23
+0
+
+#SPECIALS
+M 3000 spec_cast_mage * wizard
+S
+
+#$
+"""
+
+# the corpus the Makefile maps, checked when AREAS names it
+CORPUS = sorted(glob.glob(os.path.join(os.environ['AREAS'], '*.are'))) if os.environ.get('AREAS') else []
+
+@pytest.fixture(scope='module')
+def parsers():
+    return AreaParser.Parser(), AreaParser.Reader()
+
+def test_sample_reads_alike(parsers):
+    assert AreaParser.differences(*parsers, SAMPLE) == []
+    rooms = dict(parsers[1].parse(SAMPLE))['#ROOMS']
+    assert [(vnum, optionals) for vnum, name, desc, optionals in rooms] == [
+        (3000, [(1, 3001), (0, 3005), None]), (3001, [(1, 3002), (3, 3000), (0, 3006)])]
+
+@pytest.mark.parametrize('path', CORPUS)
+def test_corpus_reads_alike(parsers, path):
+    with open(path, 'r') as f:
+        assert AreaParser.differences(*parsers, f.read()) == []
@@ -0,0 +1,74 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pyomo.opt
+import Mapper
+import RoomGraph
+import Solvers
+
+# a ring of four rooms with a room hanging off two of them, small enough for any backend
+RECORDS = [(1, 'a', '', [(0, 2), (1, 3)]), (2, 'b', '', [(2, 1), (1, 4)]), (3, 'c', '', [(3, 1), (0, 4), (1, 5)]),
+           (4, 'd', '', [(3, 2), (2, 3)]), (5, 'e', '', [(3, 3)])]
+
+def component():
+    rdb = Mapper.materialize(RoomGraph.RoomGraph.from_records(RECORDS))
+    return rdb, list(set([e for r in rdb.values() for e in r.exits]))
+
+@pytest.mark.parametrize('name', Solvers.NAMES)
+@pytest.mark.parametrize('run', [Mapper.solve, Mapper.solve_sparse])
+def test_backend_solves(name, run):
+    if not Solvers.available(name): pytest.skip('%s is not installed'%(name))
+    rdb, exits = component()
+    model, result = run(rdb, exits, solver=name, time_limit=30)
+    assert result.solver.termination_condition == pyomo.opt.TerminationCondition.optimal
+
+def test_warmstart_only_passed_to_capable_backends(monkeypatch):
+    if not Solvers.available('highs'): pytest.skip('highs is not installed')
+    factory = Solvers.factory
+    class Cold():
+        # highs pretending to be a backend without MIP starts, like glpk
+        def __init__(self, *args):
+            self.solver = factory(*args)
+            self.options = self.solver.options
+        def warm_start_capable(self):
+            return False
+        def solve(self, model, **kwargs):
+            assert 'warmstart' not in kwargs
+            return self.solver.solve(model, **kwargs)
+    monkeypatch.setattr(Solvers, 'factory', Cold)
+    rdb, exits = component()
+    model, result = Mapper.solve(rdb, exits, solver='highs')
+    assert result.solver.termination_condition == pyomo.opt.TerminationCondition.optimal
+
+def test_persistent_solver_takes_gap_and_time_limit(monkeypatch):
+    if not Solvers.available('highs'): pytest.skip('highs is not installed')
+    plugins = pyomo.opt.SolverFactory
+    loaded = []
+    class Persistent():
+        # highs standing in for gurobi_persistent, solving whatever the model holds at each call
+        def __init__(self):
+            self.solver = Solvers.factory('highs')
+            self.options = {}
+            loaded.append(self)
+        def warm_start_capable(self):
+            return False
+        def set_instance(self, model):
+            self.model = model
+        def add_var(self, var):
+            pass
+        def add_constraint(self, constraint):
+            pass
+        def solve(self, **kwargs):
+            result = self.solver.solve(self.model, load_solutions=False, **kwargs)
+            self.model.solutions.load_from(result)
+            return result
+    monkeypatch.setattr(pyomo.opt, 'SolverFactory', lambda name: Persistent() if name in Solvers.PERSISTENT
+                                                                else plugins(name))
+    rdb, exits = component()
+    model, result = Mapper.solve(rdb, exits, persistent='gurobi_persistent', time_limit=30, gap=.1)
+    assert result.solver.termination_condition == pyomo.opt.TerminationCondition.optimal
+    assert loaded[0].options['MIPGap'] == .1 and 0 < loaded[0].options['TimeLimit'] <= 30